@@ -0,0 +1,102 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/6/3 11:40
+import threading
+
+from vefui.app import ConsoleBuffer
+
+
+def _buffer(**kwargs):
+    frames = []
+    buffer = ConsoleBuffer(lambda event, data, to: frames.append((event, data, to)), **kwargs)
+    return buffer, frames
+
+
+def _messages(frames):
+    return [(data["language"], data["message"], to) for event, data, to in frames]
+
+
+def test_put_reports_empty():
+    buffer, frames = _buffer()
+    assert buffer.put("text", "a") is True
+    assert buffer.put("text", "b") is False
+    assert len(buffer) == 2
+    buffer.flush()
+    assert len(buffer) == 0
+    assert buffer.put("text", "c") is True
+
+
+def test_batch_by_target_and_language():
+    buffer, frames = _buffer()
+    buffer.put("text", "a", "s1")
+    buffer.put("text", "b", "s1")
+    buffer.put("html", "<b>c</b>", "s1")
+    buffer.put("text", "d", "s2")
+    buffer.put("text", "e", "s1")
+    buffer.flush()
+    assert {event for event, data, to in frames} == {"console"}
+    assert _messages(frames) == [
+        ("text", "a\nb", "s1"), ("html", "<b>c</b>", "s1"), ("text", "d", "s2"), ("text", "e", "s1"),
+    ]
+
+
+def test_batch_size():
+    buffer, frames = _buffer(batch_size=2)
+    for i in range(5):
+        buffer.put("text", str(i))
+    buffer.flush()
+    assert _messages(frames) == [("text", "0\n1", None), ("text", "2\n3", None), ("text", "4", None)]
+
+
+def test_flush_empty():
+    buffer, frames = _buffer()
+    buffer.flush()
+    assert frames == []
+
+
+def test_drops_per_target():
+    buffer, frames = _buffer(capacity=3)
+    for i in range(5):
+        buffer.put("text", "a{}".format(i), "s1")
+    # a chatty target does not push out the lines of another one
+    buffer.put("text", "b0", "s2")
+    buffer.put("text", "a5", "s1")
+    assert len(buffer) == 4
+    assert buffer.dropped == {"s1": 3}
+    assert buffer.dropped_total == 3
+    assert buffer.total == 7
+    buffer.flush()
+    assert _messages(frames) == [
+        ("", "... 3 messages dropped", "s1"),
+        ("text", "a3\na4", "s1"), ("text", "b0", "s2"), ("text", "a5", "s1"),
+    ]
+    assert buffer.dropped == {}
+    # counters keep running across flushes
+    assert buffer.dropped_total == 3 and buffer.total == 7
+
+
+def test_dropped_lines_are_compacted():
+    buffer, frames = _buffer(capacity=10)
+    for i in range(10000):
+        buffer.put("text", str(i), "s1")
+    assert len(buffer) == 10
+    assert len(buffer._lines) <= 2 * len(buffer) + buffer.capacity + 1
+    buffer.flush()
+    assert _messages(frames)[1] == ("text", "\n".join(str(i) for i in range(9990, 10000)), "s1")
+
+
+def test_concurrent_put():
+    buffer, frames = _buffer(capacity=10 ** 6)
+    threads = [threading.Thread(target=lambda: [buffer.put("text", "x") for _ in range(1000)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(buffer) == buffer.total == 8000
+    buffer.flush()
+    assert sum(data["message"].count("x") for event, data, to in frames) == 8000
+
+
+if __name__ == "__main__":
+    pass
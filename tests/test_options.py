@@ -0,0 +1,71 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/6/3 10:20
+import pytest
+
+from vefui.form import Option, Select
+from vefui.options import OptionIndex
+
+CITIES = ["Paris", "Parma", "Amsterdam", "Sparta", "Berlin", "paramaribo", "Oslo"]
+
+
+def _labels(page):
+    return [label for key, label in page[0]]
+
+
+def test_keys_and_labels():
+    index = OptionIndex([Option(1, "One"), Option("two"), 3])
+    assert index.keys == [1, "two", 3]
+    assert index.labels == ["One", "two", "3"]
+    assert index.by_key == {"1": 1, "two": "two", "3": 3}
+    assert len(index) == 3
+
+
+def test_empty_query_pages_in_order():
+    index = OptionIndex(CITIES)
+    assert _labels(index.search("", 0, 3)) == CITIES[:3]
+    assert index.search("", 0, 3)[1] is True
+    page, more = index.search(None, 5, 3)
+    assert [label for key, label in page] == CITIES[5:]
+    assert more is False
+
+
+def test_prefix_matches_first():
+    index = OptionIndex(CITIES)
+    # prefix matches sorted, case insensitive, then substring matches in option order
+    assert _labels(index.search("par", 0, 50)) == ["paramaribo", "Paris", "Parma", "Sparta"]
+
+
+def test_no_duplicates():
+    # "ana" starts the label and occurs again inside it
+    index = OptionIndex(["anana", "banana", "cabana"])
+    assert _labels(index.search("ana", 0, 50)) == ["anana", "banana", "cabana"]
+
+
+def test_no_match_across_labels():
+    # labels are joined by newlines for the substring search
+    index = OptionIndex(["ab", "cd", "a\nb"])
+    assert _labels(index.search("b\nc", 0, 50)) == []
+    assert _labels(index.search("bc", 0, 50)) == []
+    assert _labels(index.search("a b", 0, 50)) == ["a\nb"]
+
+
+@pytest.mark.parametrize("offset, limit", [(0, 1), (1, 2), (2, 5), (4, 1), (10, 5)])
+def test_offset_and_limit(offset, limit):
+    index = OptionIndex(CITIES)
+    everything = _labels(index.search("a", 0, 100))
+    page, more = index.search("a", offset, limit)
+    assert [label for key, label in page] == everything[offset:offset + limit]
+    assert more == (len(everything) > offset + limit)
+
+
+def test_select_search():
+    select = Select("city", options=CITIES)
+    page, more = select.search("os", 0, 10)
+    assert [option.key for option in page] == ["Oslo"]
+    assert more is False
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,98 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/6/3 11:00
+import copy
+import random
+
+import pytest
+
+from vefui.patch import diff
+
+
+def _apply(document, ops):
+    """
+    rfc 6902 add / remove / replace, as the client applies them
+    """
+    document = copy.deepcopy(document)
+    for op in ops:
+        tokens = [t.replace("~1", "/").replace("~0", "~") for t in op["path"].split("/")[1:]]
+        if not tokens:
+            document = op["value"]
+            continue
+        parent = document
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        last = tokens[-1]
+        if isinstance(parent, list):
+            if op["op"] == "add":
+                parent.insert(len(parent) if last == "-" else int(last), op["value"])
+            elif op["op"] == "remove":
+                del parent[int(last)]
+            else:
+                parent[int(last)] = op["value"]
+        elif op["op"] == "remove":
+            del parent[last]
+        else:
+            parent[last] = op["value"]
+    return document
+
+
+@pytest.mark.parametrize("old, new", [
+    ({"a": 1}, {"a": 1}),
+    ({"a": 1}, {"a": 2}),
+    ({"a": 1}, {"b": 1}),
+    ({"a": {"b": [1, 2]}}, {"a": {"b": [1, 2, 3]}}),
+    ([1, 2, 3], [1, 3]),
+    ([1, 2, 3], [0, 1, 2, 3]),
+    ([1, 2, 3], [1, 9, 9, 3]),
+    ([1, 2, 3], []),
+    ([], [1]),
+    ({"items": [{"key": "a"}, {"key": "b"}]}, {"items": [{"key": "a", "disabled": True}, {"key": "b"}]}),
+    ({"a": [1]}, {"a": {"0": 1}}),
+    (1, "one"),
+])
+def test_round_trip(old, new):
+    assert _apply(old, diff(old, new)) == new
+
+
+def test_equal_is_empty():
+    assert diff({"a": [1, {"b": 2}]}, {"a": [1, {"b": 2}]}) == []
+
+
+def test_only_changed_fields():
+    old = {"items": [{"key": "a", "label": "A"}, {"key": "b", "label": "B"}], "version": 1}
+    new = {"items": [{"key": "a", "label": "A"}, {"key": "b", "label": "Bee"}], "version": 1}
+    assert diff(old, new) == [{"op": "replace", "path": "/items/1/label", "value": "Bee"}]
+
+
+def test_append_uses_end_token():
+    assert diff([1, 2], [1, 2, 3]) == [{"op": "add", "path": "/-", "value": 3}]
+
+
+def test_pointer_escapes():
+    ops = diff({}, {"a/b": 1, "c~d": 2})
+    assert [op["path"] for op in ops] == ["/a~1b", "/c~0d"]
+    assert _apply({}, ops) == {"a/b": 1, "c~d": 2}
+
+
+def _random_value(rng: random.Random, depth: int = 0):
+    kind = rng.randrange(4 if depth < 3 else 2)
+    if kind == 0:
+        return rng.randrange(5)
+    if kind == 1:
+        return rng.choice(["a", "b", "a/b", "~"])
+    if kind == 2:
+        return [_random_value(rng, depth + 1) for _ in range(rng.randrange(5))]
+    return {rng.choice("xyz/~"): _random_value(rng, depth + 1) for _ in range(rng.randrange(4))}
+
+
+def test_random_round_trip():
+    rng = random.Random(2021)
+    for _ in range(2000):
+        old, new = _random_value(rng), _random_value(rng)
+        assert _apply(old, diff(old, new)) == new
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,88 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/6/2 11:10
+import pytest
+
+from vefui.form import Input, Slider
+from vefui.rules import JsType, LengthRule, RequiredRule, TypeRule, compile_rules
+
+
+@pytest.mark.parametrize("value", [None, "", []])
+def test_required(value):
+    validate = compile_rules([RequiredRule()], "Name")
+    assert validate(value) == ["Name is required"]
+    assert validate("x") == []
+
+
+def test_required_message():
+    validate = compile_rules([RequiredRule(message="fill me")], "Name")
+    assert validate("") == ["fill me"]
+
+
+def test_empty_value_only_checked_by_required():
+    validate = compile_rules([TypeRule(JsType.number), LengthRule(3, 5)], "Age")
+    assert validate("") == []
+    assert validate(None) == []
+
+
+@pytest.mark.parametrize("value, errors", [
+    ("12", []),
+    ("1.5", []),
+    (7, []),
+    ("abc", ["Age must be a number"]),
+])
+def test_number_type(value, errors):
+    assert compile_rules([TypeRule(JsType.number)], "Age")(value) == errors
+
+
+def test_string_type_is_not_checked():
+    assert TypeRule(JsType.string).compile("Name") is None
+    assert compile_rules([TypeRule(JsType.string)], "Name")(12) == []
+
+
+@pytest.mark.parametrize("value, errors", [
+    ("ab", ["Code length must be between 3 and 5"]),
+    ("abc", []),
+    ("abcde", []),
+    ("abcdef", ["Code length must be between 3 and 5"]),
+])
+def test_length(value, errors):
+    assert compile_rules([LengthRule(3, 5)], "Code")(value) == errors
+
+
+def test_min_length_only():
+    validate = compile_rules([LengthRule(2, None)], "Code")
+    assert validate("a") == ["Code length must be at least 2"]
+    assert validate("a" * 1000) == []
+
+
+def test_errors_of_every_rule():
+    validate = compile_rules([TypeRule(JsType.number), LengthRule(3, 5)], "Age")
+    assert validate("ab") == ["Age must be a number", "Age length must be between 3 and 5"]
+
+
+def test_form_item_compile():
+    validate = Input("age", is_number=True, max_length=3).compile()
+    assert validate("") == ["Age is required"]
+    assert validate("12") == []
+    assert validate("x") == ["Age must be a number"]
+    assert validate("1234") == ["Age length must be between 0 and 3"]
+    # a number rule accepts 1.5, parsing as int does not
+    assert validate("1.5") == ["Age is invalid"]
+
+
+def test_form_item_not_required():
+    validate = Input("name", required=False, min_length=2).compile()
+    assert validate("") == []
+    assert validate("a") == ["Name length must be at least 2"]
+
+
+def test_form_item_parse_error():
+    validate = Slider("level", required=False).compile()
+    assert validate("3") == []
+    assert validate("high") == ["Level is invalid"]
+
+
+if __name__ == "__main__":
+    pass
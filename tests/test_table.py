@@ -0,0 +1,147 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/6/3 9:40
+import pickle
+from array import array
+
+import pytest
+
+from vefui.table import INDEX_CACHE, Table
+
+
+def _column(table: Table, name: str):
+    return table.data[table.columns.index(name)]
+
+
+def test_load_rows_as_dicts():
+    table = Table.load([{"n": 1, "x": 0.5, "s": "a"}, {"n": 2, "x": 1.5, "s": "b", "extra": 1}])
+    assert table.columns == ["n", "x", "s"]
+    assert table.rows == 2
+    assert _column(table, "n") == array("q", [1, 2])
+    assert _column(table, "x") == array("d", [0.5, 1.5])
+    assert _column(table, "s") == ["a", "b"]
+
+
+def test_load_rows_as_sequences():
+    table = Table.load(iter([(1, "a"), (2,)]), columns=["n", "s"])
+    assert table.columns == ["n", "s"]
+    assert _column(table, "s") == ["a", None]
+
+
+def test_load_columns():
+    table = Table.load({"n": range(3), "s": ["a", "b", "c"]})
+    assert _column(table, "n") == array("q", [0, 1, 2])
+    assert Table.load(table) is table
+
+
+def test_load_empty():
+    table = Table.load([], columns=["a"])
+    assert table.rows == 0
+    assert table.query() == {"total": 0, "offset": 0, "rows": []}
+
+
+@pytest.mark.parametrize("values, kind", [
+    # an int column that meets a float, None, a str or a huge int becomes a list
+    ([1, 2.5], list),
+    ([1, None], list),
+    ([1, "a"], list),
+    ([1, 2 ** 70], list),
+    ([1.0, 2], array),
+    ([True, False], list),
+])
+def test_type_promotion(values, kind):
+    column = _column(Table.load([{"v": v} for v in values]), "v")
+    assert isinstance(column, kind)
+    assert list(column) == values
+
+
+def test_columns_must_match():
+    with pytest.raises(ValueError):
+        Table(["a", "b"], [[1], [1, 2]])
+    with pytest.raises(ValueError):
+        Table(["a"], [[1], [2]])
+
+
+def test_query_page():
+    table = Table.load({"n": list(range(10))})
+    assert table.query(offset=8, limit=5) == {"total": 10, "offset": 8, "rows": [[8], [9]]}
+    assert table.query(offset=-3, limit=2)["rows"] == [[0], [1]]
+    assert table.query(offset=20)["rows"] == []
+
+
+def test_sort():
+    table = Table.load({"n": [3, 1, 2], "s": ["c", "a", "b"]})
+    assert table.query(sort="n")["rows"] == [[1, "a"], [2, "b"], [3, "c"]]
+    assert table.query(sort="s", desc=True)["rows"] == [[3, "c"], [2, "b"], [1, "a"]]
+    with pytest.raises(ValueError):
+        table.query(sort="missing")
+
+
+def test_sort_is_stable():
+    table = Table.load({"k": [1, 0, 1, 0], "i": [0, 1, 2, 3]})
+    assert [row[1] for row in table.query(sort="k")["rows"]] == [1, 3, 0, 2]
+
+
+def test_sort_mixed_types():
+    # compared as text, None last
+    table = Table.load({"v": [2, None, "a", 10]})
+    assert [row[0] for row in table.query(sort="v")["rows"]] == [10, 2, "a", None]
+
+
+def test_filter():
+    table = Table.load({"name": ["Alpha", "beta", None, "ALPHABET"], "n": [1, 2, 3, 40]})
+    page = table.query(query="alpha")
+    assert page["total"] == 2
+    assert page["rows"] == [["Alpha", 1], ["ALPHABET", 40]]
+    # every column is searched, numbers as text
+    assert table.query(query="4")["rows"] == [["ALPHABET", 40]]
+    assert table.query(query="none")["total"] == 0
+
+
+def test_filter_and_sort():
+    table = Table.load({"name": ["b1", "a1", "c2", "a2"]})
+    assert table.query(sort="name", desc=True, query="1")["rows"] == [["b1"], ["a1"]]
+
+
+def test_json_values():
+    table = Table.load({"x": [float("nan"), 1.5], "o": [object, b"x"]})
+    rows = table.query()["rows"]
+    assert rows[0][0] is None and rows[1][0] == 1.5
+    assert rows[0][1] == str(object) and rows[1][1] == "b'x'"
+
+
+def test_index_cache():
+    table = Table.load({"n": list(range(5))})
+    assert table._index(None, False, "") is None
+    index = table._index("n", True, "")
+    assert table._index("n", True, "") is index
+    for i in range(INDEX_CACHE):
+        table.query(query=str(i))
+    assert len(table._indexes) == INDEX_CACHE
+    # least recently used first out
+    assert ("n", True, "") not in table._indexes
+    table.query(query="0")
+    table.query(query="x")
+    assert (None, False, "0") in table._indexes
+    assert (None, False, "1") not in table._indexes
+
+
+def test_pickle_drops_caches():
+    table = Table.load({"n": [2, 1]})
+    table.query(sort="n")
+    copy = pickle.loads(pickle.dumps(table))
+    assert copy.columns == ["n"] and copy.rows == 2
+    assert not copy._indexes
+    assert copy.query(sort="n")["rows"] == [[1], [2]]
+
+
+def test_numpy_columns():
+    np = pytest.importorskip("numpy")
+    table = Table.load({"n": np.array([3, 1, 2]), "s": np.array(["c", "a", "b"])})
+    assert isinstance(_column(table, "s"), list)
+    assert table.query(sort="n", desc=True)["rows"] == [[3, "c"], [2, "b"], [1, "a"]]
+
+
+if __name__ == "__main__":
+    pass
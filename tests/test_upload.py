@@ -0,0 +1,117 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/6/2 10:30
+import hashlib
+import io
+
+import pytest
+
+from vefui.upload import MultipartError, UploadHandle, UploadWriter, parse_multipart
+
+BOUNDARY = b"----vefui1234"
+
+
+def _body(*parts, end: bool = True) -> bytes:
+    """
+    :param parts: (key, value) fields or (key, filename, content) files
+    """
+    body = b""
+    for part in parts:
+        body += b"--" + BOUNDARY + b"\r\n"
+        if len(part) == 2:
+            body += 'Content-Disposition: form-data; name="{}"\r\n\r\n'.format(part[0]).encode() + part[1]
+        else:
+            body += 'Content-Disposition: form-data; name="{}"; filename="{}"\r\n'.format(*part[:2]).encode()
+            body += b"Content-Type: application/octet-stream\r\n\r\n" + part[2]
+        body += b"\r\n"
+    if end:
+        body += b"--" + BOUNDARY + b"--\r\n"
+    return body
+
+
+def _discard(key, filename):
+    return None
+
+
+def _parse(body: bytes, folder, read_size: int = 64 * 1024, max_size: int = None):
+    def on_file(key, filename):
+        return UploadWriter(key, folder.joinpath(filename), chunk_size=4, max_size=max_size)
+    return parse_multipart(io.BytesIO(body), BOUNDARY, on_file, read_size=read_size)
+
+
+@pytest.mark.parametrize("read_size", [1, 2, 3, 7, len(BOUNDARY) + 1, 64 * 1024])
+def test_boundary_split_across_reads(tmp_path, read_size):
+    content = bytes(range(256)) * 3
+    fields, files = _parse(_body(("name", b"vefui"), ("data", "a.bin", content)), tmp_path, read_size)
+    assert fields == {"name": "vefui"}
+    assert tmp_path.joinpath("a.bin").read_bytes() == content
+    assert files["data"].size == len(content)
+    assert files["data"].checksum == hashlib.sha256(content).hexdigest()
+
+
+@pytest.mark.parametrize("read_size", [1, 5, 64 * 1024])
+def test_crlf_in_body(tmp_path, read_size):
+    # line breaks and a partial delimiter are content, only CRLF--boundary ends a part
+    content = b"\r\n\r\nline\r\n--" + BOUNDARY[:-1] + b"\r\n-\r\n"
+    value = b"first\r\nsecond\r\n"
+    fields, files = _parse(_body(("text", value), ("data", "crlf.txt", content)), tmp_path, read_size)
+    assert fields["text"] == value.decode()
+    assert tmp_path.joinpath("crlf.txt").read_bytes() == content
+
+
+def test_empty_parts(tmp_path):
+    fields, files = _parse(_body(("text", b""), ("data", "empty.bin", b"")), tmp_path)
+    assert fields == {"text": ""}
+    assert files["data"].size == 0
+    assert tmp_path.joinpath("empty.bin").read_bytes() == b""
+
+
+def test_missing_final_boundary(tmp_path):
+    body = _body(("name", b"vefui"), ("data", "a.bin", b"x" * 100), end=False)
+    with pytest.raises(MultipartError):
+        _parse(body, tmp_path, read_size=16)
+
+
+def test_truncated_file_is_removed(tmp_path):
+    body = _body(("data", "a.bin", b"x" * 100))
+    with pytest.raises(MultipartError):
+        _parse(body[:-len(BOUNDARY) - 20], tmp_path, read_size=16)
+    assert not tmp_path.joinpath("a.bin").exists()
+
+
+def test_max_size(tmp_path):
+    fields, files = _parse(_body(("data", "fits.bin", b"x" * 10)), tmp_path, max_size=10)
+    assert files["data"].size == 10
+    with pytest.raises(MultipartError, match="exceeds max size"):
+        _parse(_body(("data", "big.bin", b"x" * 11)), tmp_path, read_size=3, max_size=10)
+    assert not tmp_path.joinpath("big.bin").exists()
+
+
+def test_header_size():
+    body = b"--" + BOUNDARY + b"\r\nContent-Disposition: form-data; name=\"a\"\r\nX-Pad: " + b"x" * 100
+    with pytest.raises(MultipartError, match="part header exceeds 64 bytes"):
+        # the header never ends, it is not read to the end of the body
+        parse_multipart(io.BytesIO(body + b"x" * 10 ** 6), BOUNDARY, _discard, read_size=16, max_header_size=64)
+
+
+def test_field_size():
+    fields, files = parse_multipart(io.BytesIO(_body(("text", b"x" * 10))), BOUNDARY, _discard, max_field_size=10)
+    assert fields == {"text": "x" * 10}
+    with pytest.raises(MultipartError, match="field text exceeds 10 bytes"):
+        parse_multipart(io.BytesIO(_body(("text", b"x" * 11))), BOUNDARY, _discard, read_size=3, max_field_size=10)
+
+
+def test_upload_handle_as_path(tmp_path):
+    path = tmp_path.joinpath("a.bin")
+    path.write_bytes(b"vefui")
+    with UploadHandle(path) as handle:
+        assert handle == path and path == handle
+        assert {path: 1}[handle] == 1
+        assert handle / "x" == path / "x"
+        assert handle.parent / "x" == tmp_path / "x"
+        assert handle.read_bytes() == bytes(handle.view) == b"vefui"
+
+
+if __name__ == "__main__":
+    pass
@@ -2,22 +2,45 @@
 # -*- coding:utf-8 -*-
 # @Author : zander
 # @Time : 2021/2/20 14:34
-import gevent as gvt
-from vefui.form import FormItem
-from vefui.app import create_app, IOApp
+from vefui.startup import ORIGIN, LazyModule, StartupProfile
+from vefui.form import FormItem, Upload, Select, DataTable
 from vefui.errors import ExistedError
-from flask import render_template, request, jsonify
+from vefui.task import TaskExecutor, Task, TaskStatus, current_task, forward
+from vefui.progress import ProgressThrottle, progress_state, run_callback
+from vefui.schema import SchemaCache
+from vefui.table import Table
+from vefui.patch import diff
+from vefui.metrics import Metrics, NullMetrics, CONTENT_TYPE
+from vefui.session import Session, SESSION_KEY
+from vefui.blobs import BlobStore
+from vefui.upload import UploadWriter, UploadedFile, UploadHandle, ChunkedUploadStore, MultipartError, parse_multipart
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional
+from dataclasses import make_dataclass
+from copy import deepcopy
+from keyword import iskeyword
 from vefui import chrome as brw
-from engineio.async_drivers import gevent
+import json
+import os
 import sys
+import threading
+import time
+import uuid
+import warnings
+
+# flask, gevent and socket.io are only imported by run()
+flask = LazyModule("flask")
 
 Components = Dict[str, FormItem]
 
+_IMPORTED = time.perf_counter()
+
 
 class VefUI:
 
+    # attributes rendered into /init
+    _SCHEMA_FIELDS = {"title", "debug", "size", "lang", "messages", "form_options"}
+
     def __init__(self, title: str,
                  workspace: Path = None,
                  debug: bool = False,
@@ -25,6 +48,18 @@ class VefUI:
                  size: tuple = (640, 720),
                  position: tuple = (320, 200),
                  lang_messages: dict = None,
+                 executor: str = "thread",
+                 workers: int = 1,
+                 console_interval: float = 0.05,
+                 console_capacity: int = 10000,
+                 console_replay: int = 1000,
+                 progress_interval: float = 0.1,
+                 broadcast: bool = False,
+                 upload_store_size: int = None,
+                 upload_pending_size: int = None,
+                 metrics: bool = False,
+                 history: bool = False,
+                 secret_key: bytes = None,
                  **options):
         """
 
@@ -35,23 +70,79 @@ class VefUI:
         :param debug: if not, client will be exit on websocket disconnect
         :param lang: language, default en. allow [en, zh-cn ]
         :param lang_messages: rewrite client text
+        :param executor: run submit callback in thread | process pool, default: thread
+        :param workers: executor pool size, default 1
+        :param console_interval: console messages are batched and sent every interval seconds
+        :param console_capacity: max buffered console messages, the oldest are dropped beyond it
+        :param console_replay: console frames and events kept to send again to a client that reconnects
+        :param progress_interval: progress updates are merged and sent at most once per interval seconds
+        :param broadcast: send console messages to every client instead of the submitting session
+        :param upload_store_size: bytes of uploads kept, the least recently used are removed beyond it,
+            default: unlimited
+        :param upload_pending_size: bytes preallocated for unfinished resumable uploads,
+            default: the free disk space
+        :param metrics: record timings and counters, served on /metrics in the prometheus format
+        :param history: keep submitted tasks, inputs and console output in workspace/history.db,
+            served on /history
+        :param secret_key: signs the session cookie, default: random per run
         :param options:
             :param options -> label_position: left | right | top ; default: top
             :param options -> label_width: default 120
             :param options -> label_suffix: default ' : '
             :param options -> submit_text: default "Submit"
         """
+        self._schema = SchemaCache(self._schema_data)
+        self._schema_lock = threading.Lock()
+        self._schema_version = 0
+        # schema the clients have, patches are computed against it
+        self._pushed = None
         self.title = title or "UnTitled"
 
         self.workspace = workspace or Path(sys.argv[0]).parent
         self.chrome_path = self.workspace.joinpath("chrome")
         self.upload_path = self.workspace.joinpath("upload")
+        self.uploads = ChunkedUploadStore(self.upload_path.joinpath(".partial"), upload_pending_size)
+        # uploads stored once by content, each session gets a link named as uploaded
+        self.blobs = BlobStore(self.upload_path.joinpath(".blobs"), upload_store_size, pinned=self._pinned_uploads)
         self.app = None
         self.io = None
+        # served without a browser, kept alive across disconnects
+        self.headless = False
+        self.startup = StartupProfile(ORIGIN)
+        self.startup_report = False
+        self.startup.phases.append(("import vefui", 0.0, _IMPORTED - ORIGIN))
         self.debug = debug
         self.__components: Components = {}
         self.items = []
         self.submit_callback = None
+        self.executor = None
+        self.executor_mode = executor
+        self.workers = workers
+        self.console_options = {
+            "console_interval": console_interval,
+            "console_capacity": console_capacity,
+            "replay_capacity": console_replay
+        }
+        self.progress_interval = progress_interval
+        self.broadcast = broadcast
+        # generated before worker processes fork, they all accept the same cookies
+        self.secret_key = secret_key or os.urandom(32)
+        self.metrics = Metrics() if metrics else NullMetrics()
+        self._m_submit = self.metrics.histogram("vefui_submit_seconds", "/submit, uploads included")
+        self._m_submits = self.metrics.counter("vefui_submit_total", "submits by result", ("result",))
+        self._m_upload_bytes = self.metrics.counter("vefui_upload_bytes_total", "uploaded bytes saved")
+        self._m_init = self.metrics.histogram("vefui_init_seconds", "/init")
+        self._m_parse = self.metrics.histogram("vefui_value_parse_seconds", "value conversion, cache misses only")
+        self._m_task = self.metrics.histogram("vefui_task_seconds", "submit callback run time")
+        self._m_task_wait = self.metrics.histogram("vefui_task_wait_seconds", "time from submit to a free worker")
+        self._m_tasks = self.metrics.counter("vefui_tasks_total", "finished tasks by status", ("status",))
+        self.metrics.gauge("vefui_tasks_running", "tasks running or waiting for a worker", self._running_tasks)
+        # values seen outside of a request or task
+        self._last_session = Session()
+        # tables filled for every client
+        self._tables: Dict[str, Table] = {}
+        self.history_enabled = history
+        self.history = None
 
         # browser option
         self.size = size
@@ -67,24 +158,123 @@ class VefUI:
         }
 
         self._form_default = {}
+        self._validators = {}
+        self._snapshot_class = None
+        # rendered index.html by (title, lang)
+        self._index_cache = {}
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name in self._SCHEMA_FIELDS:
+            self._push_schema()
+
+    def invalidate(self):
+        """
+        rebuild /init on next request, call it after changing an added item in place.
+        once running, clients get the changes as a patch
+        """
+        self._push_schema()
+
+    def _push_schema(self):
+        self._schema.invalidate()
+        if getattr(self, "io", None) is None:
+            return
+        with self._schema_lock:
+            data = self._schema_data()
+            patch = diff(self._pushed, data)
+            if not patch:
+                return
+            self._schema_version += 1
+            data["version"] = self._schema_version
+            patch.append({"op": "replace", "path": "/version", "value": self._schema_version})
+            self._pushed = deepcopy(data)
+            self._schema.invalidate()
+        # the schema patched is the one of this worker
+        self.io.send({"patch": patch}, language="json", event="schema:patch", local=True)
+
+    def _session(self, create: bool = False) -> Optional[Session]:
+        """
+        session of the running task or of the current request
+        :param create: start a session for a request without one
+        """
+        task = current_task()
+        if task is not None:
+            return task.session
+        if not flask.has_request_context() or self.io is None:
+            return None
+        sid = getattr(flask.request, "sid", None)
+        if sid is not None:
+            return self.io.sessions.by_sid(sid)
+        session_id = flask.session.get(SESSION_KEY, None)
+        if not create:
+            return self.io.sessions.get(session_id)
+        session = self.io.sessions.get_or_create(session_id)
+        flask.session[SESSION_KEY] = session.id
+        return session
+
+    def _state(self):
+        """
+        where values are read from: the running task's snapshot, else the session.
+        out of both, the last submit of the only window, nothing when serving many users
+        """
+        task = current_task()
+        if task is not None:
+            return task
+        session = self._session()
+        if session is not None:
+            return session
+        return Session() if self.headless else self._last_session
 
     def get_value(self, key: str, default=None):
         component = self.__components.get(key, None)
         if component is None:
             return default
-        return component.value
+        state = self._state()
+        # converted once per submit
+        if key not in state.typed:
+            value = state.values.get(key, None)
+            if key in state.files:
+                # an upload handle starts with the size and checksum taken while receiving
+                value = UploadHandle.of(state.files[key])
+            with self._m_parse.time():
+                state.typed[key] = component.parse(value)
+        return state.typed[key]
 
-    def _set_value(self, key: str, value) -> None:
+    def get_values(self) -> dict:
+        """
+        all values, converted
+        """
+        return {key: self.get_value(key) for key in self.__components}
+
+    def snapshot(self):
+        """
+        all values as a frozen dataclass, keys that are not identifiers are only in get_values()
+        """
+        if self._snapshot_class is None:
+            fields = [key for key in self.__components if key.isidentifier() and not iskeyword(key)]
+            self._snapshot_class = make_dataclass("FormValues", fields, frozen=True)
+        values = self.get_values()
+        return self._snapshot_class(**{f: values[f] for f in self._snapshot_class.__dataclass_fields__})
+
+    def get_file(self, key: str) -> Optional[UploadedFile]:
+        """
+        size and checksum of an uploaded file
+        """
+        return self._state().files.get(key, None)
+
+    def _set_value(self, key: str, value, state=None) -> None:
         """
         set component value
         :param key:
         :param value:
+        :param state: session or task, default the current one
         :return:
         """
-        component = self.__components.get(key, None)
-        if component is None:
+        if key not in self.__components:
             return
-        component.value = value
+        state = state or self._state()
+        state.values[key] = value
+        state.typed.pop(key, None)
 
     def add(self, item: FormItem):
         if item.key in self.__components:
@@ -92,54 +282,516 @@ class VefUI:
         self.__components[item.key] = item
         self.items.append(item.json())
         self._form_default[item.key] = item.default
-        pass
+        self._validators[item.key] = item.compile()
+        self._snapshot_class = None
+        self._push_schema()
+
+    def update(self, key: str, **changes):
+        """
+        change an added item, running clients get a patch instead of a reload.
+        app.update("city", options=cities, disabled=False)
+        """
+        item = self.__components[key]
+        item.update(**changes)
+        self.items[self._item_index(key)] = item.json()
+        self._form_default[key] = item.default
+        self._validators[key] = item.compile()
+        self._push_schema()
+
+    def remove(self, key: str):
+        item = self.__components.pop(key)
+        del self.items[self._item_index(key)]
+        self._form_default.pop(key, None)
+        self._validators.pop(key, None)
+        self._snapshot_class = None
+        self._push_schema()
+        return item
+
+    def _item_index(self, key: str) -> int:
+        for i, data in enumerate(self.items):
+            if data["key"] == key:
+                return i
+        raise KeyError(key)
 
     def on_submit(self):
+        """
+        register the submit callback: a function, a generator or an async def.
+        every value a generator yields is a progress update, see progress().
+        """
         # wrap func
         def decorator(f):
             self.submit_callback = f
         return decorator
 
-    def console(self, message, language: str = "",  event: str = "console"):
+    def console(self, message, language: str = "",  event: str = "console", broadcast: bool = None):
         """
         send message to client by ws.
         :param message:
         :param language: highlight language
         :param event:
+        :param broadcast: send to every client, default: the submitting session only
+        """
+        try:
+            to = self._target(broadcast)
+        except LookupError as e:
+            warnings.warn(e.args[0], RuntimeWarning, stacklevel=2)
+            return
+        self.io.send(message, language, event, to)
+        task = current_task()
+        if self.history is not None and task is not None and event == "console":
+            self.history.console(task.id, message if isinstance(message, str) else json.dumps(message), language)
+
+    def progress(self, update=None, **fields):
+        """
+        report progress of the running submit task, sent on task:progress.
+        updates are merged and sent at most once per progress_interval, the last one always goes out.
+        :param update: 0.3 -> value, (3, 10) -> done / total, "text" -> message, dict -> merged
+        :param fields: merged as well, e.g. message="reading"
+        """
+        task = current_task()
+        if task is None or task.progress is None:
+            return
+        task.progress.update(dict(progress_state(update), **fields) if fields else update)
+
+    def _run_submit(self):
+        task = current_task()
+        to = self._target()
+        task.progress = ProgressThrottle(
+            lambda state: self.io.send(dict(state, task=task.id), "json", "task:progress", to),
+            self.progress_interval)
+        try:
+            run_callback(self.submit_callback, task.progress.update, lambda: task.cancelled)
+        finally:
+            # the last state goes out before task:complete
+            task.progress.close()
+            for value in task.typed.values():
+                if isinstance(value, UploadHandle):
+                    value.close()
+
+    def result(self, data, name: str = None, mimetype: str = None, broadcast: bool = None) -> str:
+        """
+        send a large result as binary frames instead of a console message.
+        :param data: bytes, memoryview, numpy array, str, or rows / dicts
+        :param name: file name when the client saves it
+        :param mimetype:
+        :param broadcast: send to every client, default: the submitting session only
+        :return: result id
+        :raise LookupError: no session to send to, see _target
+        """
+        return self.io.send_result(data, name, mimetype, self._target(broadcast))
+
+    def table(self, key: str, source, broadcast: bool = None) -> Table:
+        """
+        fill a DataTable, the browser reads the rows page by page.
+        :param key: DataTable key
+        :param source: rows as dicts or sequences, an iterator of rows, a dict of columns or a DataFrame
+        :param broadcast: show to every client, default: the submitting session only
+        :return: the table, kept column by column
+        :raise LookupError: no session to send to, see _target
+        """
+        component = self.__components.get(key, None)
+        if not isinstance(component, DataTable):
+            raise KeyError(key)
+        table = Table.load(source, component.columns)
+        to = self._target(broadcast)
+        if not forward("table", key, table, to):
+            self._put_table(key, table, to)
+        return table
+
+    def _put_table(self, key: str, table: Table, to: str = None):
+        if to is None:
+            self._tables[key] = table
+        else:
+            session = self.io.sessions.get(to)
+            if session is None:
+                return
+            session.tables[key] = table
+        # the table is kept by this worker, clients of other workers could not page it
+        self.io.send(dict(table.json(), key=key), language="json", event="table:update", to=to, local=True)
+
+    def _on_task_table(self, task: Task, key: str, table: Table, to: str = None):
+        # filled in a process worker
+        self._put_table(key, table, to)
+
+    def _target(self, broadcast: bool = None) -> Optional[str]:
+        """
+        :return: room of the current session, None for every client
+        :raise LookupError: no session when serving many users, e.g. in a thread the callback
+            started outside of contextvars.copy_context()
+        """
+        if self.broadcast if broadcast is None else broadcast:
+            return None
+        session = self._session()
+        if session is not None:
+            return session.id
+        if not self.headless:
+            # the only window
+            return None
+        raise LookupError("no session to send to, run threads started by the callback "
+                          "in contextvars.copy_context()")
+
+    def flush(self):
+        """
+        send buffered console messages now
+        """
+        self.io.flush()
+
+    @property
+    def cancelled(self) -> bool:
+        """
+        True if the running submit task has been cancelled, check it in long loops.
+        """
+        task = current_task()
+        return task is not None and task.cancelled
+
+    def cancel(self, task_id: str) -> bool:
+        return self.executor.cancel(task_id)
+
+    def _uploads_in_use(self) -> list:
         """
-        self.io.send(message, language, event)
+        UploadedFile of unfinished tasks and sessions
+        """
+        states = []
+        if self.executor is not None:
+            states.extend(task for task in list(self.executor.tasks.values()) if task.finished is None)
+        if self.io is not None:
+            states.extend(list(self.io.sessions.sessions.values()))
+        states.append(self._last_session)
+        return [f for state in states for f in list(state.files.values()) if isinstance(f, UploadedFile)]
+
+    def _pinned_uploads(self):
+        """
+        checksums of the files unfinished tasks and sessions point to
+        """
+        return {f.checksum for f in self._uploads_in_use() if f.checksum}
+
+    def _running_tasks(self) -> int:
+        if self.executor is None:
+            return 0
+        return sum(1 for task in list(self.executor.tasks.values()) if task.finished is None)
+
+    def _on_task_output(self, task: Task, message, language: str = "", event: str = "console", to: str = None,
+                        local: bool = False):
+        if self.history is not None and event == "console":
+            self.history.console(task.id, message if isinstance(message, str) else json.dumps(message), language)
+
+    def _on_task_complete(self, task: Task):
+        if self.history is not None:
+            self.history.record(task)
+        self._m_tasks.inc(1, task.status.value)
+        if task.started is not None:
+            self._m_task_wait.observe(task.started - task.created)
+            self._m_task.observe((task.finished or time.time()) - task.started)
+        to = task.session.id if task.session is not None and not self.broadcast else None
+        if task.status == TaskStatus.failed:
+            self.io.send(task.error, to=to)
+        elif task.status == TaskStatus.cancelled:
+            self.io.send("cancelled", to=to)
+        self.io.send(task.json(), language="json", event="task:complete", to=to)
 
     def _index(self):
-        return render_template("index.html", title=self.title, lang=self.lang)
+        self.startup.mark("first page")
+        self._session(create=True)
+        key = (self.title, self.lang)
+        if key not in self._index_cache:
+            self._index_cache[key] = flask.render_template("index.html", title=self.title, lang=self.lang)
+        return self._index_cache[key]
+
+    def _validate_field(self, key: str, value, errors: dict):
+        validator = self._validators.get(key, None)
+        if validator is None or self.__components[key].disabled:
+            return
+        messages = validator(value)
+        if messages:
+            errors[key] = messages
+        else:
+            errors.pop(key, None)
+
+    def _validate(self, form, filenames: dict, session: Session) -> dict:
+        """
+        run the compiled validators over the whole payload
+        :param form: submitted fields
+        :param filenames: submitted file names by key
+        :param session: submitting session, holds finished resumable uploads
+        :return: error messages by key
+        """
+        errors = {}
+        for key, component in self.__components.items():
+            if isinstance(component, Upload):
+                value = filenames.get(key, None) or session.values.get(key, None)
+            else:
+                value = form.get(key, None)
+            self._validate_field(key, value, errors)
+        return errors
+
+    def _upload_target(self, session: Session, key: str, filename: str) -> Path:
+        """
+        a new name for an upload, upload/<session>/<key>/<id>/<filename>: two fields, or a running
+        task and the next submit, never share a file. names no longer in use are removed.
+        """
+        folder = self.upload_path.joinpath(session.id, key)
+        if folder.exists():
+            used = {str(f.path) for f in self._uploads_in_use()}
+            for old in list(folder.iterdir()):
+                names = list(old.iterdir())
+                if any(str(name) in used for name in names):
+                    continue
+                for name in names:
+                    self.blobs.unlink(name)
+                try:
+                    old.rmdir()
+                except OSError:
+                    pass
+        path = folder.joinpath(uuid.uuid4().hex, filename)
+        path.parent.mkdir(parents=True)
+        return path
+
+    def _store_upload(self, session: Session, key: str, received: Path, filename: str, size: int,
+                      checksum: str):
+        """
+        keep a received file as the value of key
+        :param received: temp file, moved into the blob store
+        """
+        path = self.blobs.add(received, checksum, size, self._upload_target(session, key, filename))
+        session.uploaded.add(checksum)
+        session.files[key] = UploadedFile(path, size, checksum)
+        self._set_value(key, path, session)
+
+    def _open_upload(self, key: str, filename: str, session: Session):
+        component = self.__components.get(key, None)
+        if not isinstance(component, Upload):
+            return None
+        return UploadWriter(key, self.blobs.temp(),
+                            chunk_size=component.chunk_size,
+                            max_size=component.max_size,
+                            on_progress=self._upload_progress(),
+                            filename=filename)
+
+    def _upload_progress(self, interval: float = 0.2):
+        total = flask.request.content_length
+        last = [0.0]
+
+        def progress(writer: UploadWriter):
+            now = time.monotonic()
+            if now - last[0] < interval:
+                return
+            last[0] = now
+            self.console({
+                "key": writer.key,
+                "filename": writer.filename,
+                "received": writer.size,
+                "total": total
+            }, language="json", event="upload:progress")
+        return progress
 
     def _submit(self):
+        with self._m_submit.time():
+            result = self._submit_form()
+        self._m_submits.inc(1, "ok" if result["ok"] else "invalid" if "errors" in result else "error")
+        return result
+
+    def _submit_form(self):
+        session = self._session(create=True)
+        files = {}
+        filenames = {}
+        errors = {}
+
+        def open_upload(key: str, filename: str):
+            filenames[key] = filename
+            if errors:
+                # nothing is written once the form is known to be invalid
+                return None
+            return self._open_upload(key, filename, session)
+
         try:
-            if request.files:
-                if not self.upload_path.exists():
-                    self.upload_path.mkdir()
+            if flask.request.mimetype == "multipart/form-data":
+                boundary = flask.request.mimetype_params.get("boundary", "")
+                form, files = parse_multipart(
+                    flask.request.stream, boundary.encode("latin-1"), open_upload,
+                    on_field=lambda key, value: self._validate_field(key, value, errors))
+            else:
+                form = flask.request.form
 
-                for key in request.files.keys():
-                    file = request.files[key]
-                    path = self.upload_path.joinpath(file.filename)
-                    file.save(path)
-                    self._set_value(key, path)
+            errors = self._validate(form, filenames, session)
+            if errors:
+                for writer in files.values():
+                    writer.abort()
+                self.console(errors, language="json")
+                return {"ok": False, "error": "Form Validate Error.", "errors": errors}
 
+            for key, writer in files.items():
+                self._m_upload_bytes.inc(writer.size)
+                self._store_upload(session, key, writer.path, writer.filename, writer.size, writer.checksum)
             for key in self.__components:
-                if key in request.form.keys():
-                    self._set_value(key, request.form.get(key, None))
+                if key in form.keys():
+                    self._set_value(key, form.get(key, None), session)
         except Exception as e:
+            for writer in files.values():
+                writer.abort()
             self.console(e.args[0])
             return {"ok": False, "error": e.args[0]}
         else:
-            self.submit_callback()
-            self.console("complete", event="task:complete")
-            return {"ok": True}
+            self._last_session = session
+            task = self.executor.submit(self._run_submit, session)
+            if self.history is not None:
+                self.history.record(task, replace=False)
+            return {"ok": True, "task": task.id}
+
+    def _upload_init(self, key: str):
+        component = self.__components.get(key, None)
+        if not isinstance(component, Upload):
+            return {"ok": False, "error": "{} is not an upload".format(key)}, 404
+        data = flask.request.get_json(force=True, silent=True) or {}
+        size = data.get("size", None)
+        if type(size) is not int or size < 0 or not isinstance(data.get("filename", None), str):
+            return {"ok": False, "error": "filename and a size in bytes are required"}, 400
+        if component.max_size is not None and size > component.max_size:
+            return {"ok": False, "error": "{} exceeds max size {} bytes".format(data["filename"], component.max_size)}, 413
+        session = self._session(create=True)
+        filename = Path(data["filename"]).name
+        checksum = data.get("checksum", None)
+        if isinstance(checksum, str) and checksum in session.uploaded and self.blobs.get(checksum, size) is not None:
+            # content this session sent before, nothing to send. a checksum alone does not
+            # give access to the files of other sessions
+            path = self.blobs.link(checksum, self._upload_target(session, key, filename))
+            session.files[key] = UploadedFile(path, size, checksum)
+            self._set_value(key, path, session)
+            return {"ok": True, "upload": None, "checksum": checksum}
+        try:
+            upload = self.uploads.open(key, filename, size,
+                                       part_size=component.part_size,
+                                       fingerprint="{}:{}".format(session.id, data.get("fingerprint", "")))
+        except MultipartError as e:
+            return {"ok": False, "error": e.args[0]}, 413
+        return {"ok": True, "upload": upload.json()}
+
+    def _upload_part(self, upload_id: str, offset: int):
+        upload = self.uploads.get(upload_id)
+        if upload is None:
+            return {"ok": False, "error": "upload not found"}, 404
+        try:
+            self._m_upload_bytes.inc(upload.write(offset, flask.request.stream))
+        except MultipartError as e:
+            return {"ok": False, "error": e.args[0]}, 400
+        return {"ok": True, "received": len(upload.received), "parts": upload.parts}
+
+    def _upload_status(self, upload_id: str):
+        upload = self.uploads.get(upload_id)
+        if upload is None:
+            return {"ok": False, "error": "upload not found"}, 404
+        return {"ok": True, "upload": upload.json()}
+
+    def _upload_finalize(self, upload_id: str):
+        upload = self.uploads.get(upload_id)
+        if upload is None:
+            return {"ok": False, "error": "upload not found"}, 404
+        session = self._session(create=True)
+        received = self.blobs.temp()
+        try:
+            self.uploads.finalize(upload_id, received)
+        except MultipartError as e:
+            return {"ok": False, "error": e.args[0], "missing": upload.missing()}, 409
+        self._store_upload(session, upload.key, received, upload.filename, upload.size, upload.checksum)
+        return {"ok": True, "checksum": upload.checksum}
+
+    def _table(self, key: str):
+        component = self.__components.get(key, None)
+        if not isinstance(component, DataTable):
+            return {"ok": False, "error": "{} is not a table".format(key)}, 404
+        session = self._session()
+        table = session.tables.get(key, None) if session is not None else None
+        if table is None:
+            table = self._tables.get(key, None)
+        if table is None:
+            return {"ok": True, "columns": component.columns or [], "total": 0, "offset": 0, "rows": []}
+        args = flask.request.args
+        limit = max(1, min(args.get("limit", component.page_size, type=int), 1000))
+        try:
+            page = table.query(max(0, args.get("offset", 0, type=int)), limit, sort=args.get("sort", None),
+                               desc=args.get("desc", "") in ("1", "true"), query=args.get("q", ""))
+        except ValueError as e:
+            return {"ok": False, "error": e.args[0]}, 400
+        return dict(page, ok=True, columns=table.columns)
+
+    def _options(self, key: str):
+        component = self.__components.get(key, None)
+        if not isinstance(component, Select):
+            return {"ok": False, "error": "{} is not a select".format(key)}, 404
+        args = flask.request.args
+        limit = max(1, min(args.get("limit", component.page_size, type=int), 500))
+        page, more = component.search(args.get("q", ""), max(0, args.get("offset", 0, type=int)), limit)
+        return {"ok": True, "options": [option.json() for option in page], "more": more}
+
+    def _own_task(self, task_id: str) -> Optional[Task]:
+        """
+        task of the current session, sessions can not see each other's tasks
+        """
+        task = self.executor.get(task_id)
+        if task is None or task.session is not self._session():
+            return None
+        return task
+
+    def _cancel(self, task_id: str):
+        task = self._own_task(task_id)
+        return {"ok": task is not None and self.cancel(task.id)}
+
+    def _on_cancel_event(self, data):
+        task = self._own_task(data.get("task", "") if isinstance(data, dict) else data)
+        if task is not None:
+            self.cancel(task.id)
+
+    def _task(self, task_id: str):
+        task = self._own_task(task_id)
+        if task is None:
+            return {"ok": False, "error": "task not found"}, 404
+        return {"ok": True, "task": task.json()}
+
+    def _history(self):
+        args = flask.request.args
+        session = self._history_session()
+        if session == "":
+            # a client without a session has no runs
+            return {"ok": True, "tasks": [], "next": None}
+        limit = max(1, min(args.get("limit", 50, type=int), 500))
+        before = args.get("before", None, type=float)
+        page = self.history.recent(limit, before, args.get("status", None), session)
+        return {"ok": True, **page}
+
+    def _history_task(self, task_id: str):
+        data = self.history.get(task_id)
+        session = self._history_session()
+        if data is None or (session is not None and data["session"] != session):
+            return {"ok": False, "error": "task not found"}, 404
+        args = flask.request.args
+        data["console"] = self.history.output(task_id, max(0, args.get("offset", 0, type=int)),
+                                              max(1, min(args.get("limit", 1000, type=int), 10000)))
+        return {"ok": True, "task": data}
+
+    def _history_session(self) -> Optional[str]:
+        """
+        a served app shows each session its own runs, a desktop app shows every run
+        """
+        if not self.headless:
+            return None
+        session = self._session()
+        return session.id if session is not None else ""
+
+    def _open_history(self, recover: bool = True):
+        from vefui.history import TaskHistory
+        return TaskHistory(self.workspace.joinpath("history.db"), recover=recover)
 
     def _init(self):
-        return jsonify({
+        with self._m_init.time():
+            return self._schema.response()
+
+    def _metrics(self):
+        return flask.Response(self.metrics.render(), content_type=CONTENT_TYPE)
+
+    def _schema_data(self) -> dict:
+        return {
             "form": {
-                "items": self.items,
-                "default": self._form_default,
+                "items": list(self.items),
+                "default": dict(self._form_default),
                 "option": self.form_options
             },
             "debug": self.debug,
@@ -150,20 +802,122 @@ class VefUI:
                 "minWidth": self.size[0]
             },
             "messages": self.messages,
-            "lang": self.lang
-        })
+            "lang": self.lang,
+            "version": self._schema_version
+        }
 
-    def run(self, port: int = 9030, flags: str = ""):
-        self.app, self.io = create_app(debug=self.debug)
+    def _on_connect(self, session: Session):
+        self.startup.mark("connected")
+        if self.startup_report:
+            self.startup_report = False
+            text = self.startup.dump(self.workspace.joinpath("startup.json"))
+            if self.debug:
+                self.io.send(text, language="json", to=session.id)
+
+    def _create_app(self, assets=None, client_manager=None, secret_key: bytes = None):
+        """
+        :param assets: AssetServer shared with other apps
+        :param client_manager: socket.io client manager of worker processes
+        :param secret_key: shared with other apps, default: secret_key of this form
+        """
+        from vefui.app import create_app
+        self.app, self.io = create_app(debug=self.debug, asset_cache=self.workspace.joinpath(".assets"),
+                                      assets=assets, exit_on_close=not (self.debug or self.headless),
+                                      metrics=self.metrics, client_manager=client_manager,
+                                      secret_key=secret_key or self.secret_key,
+                                      **self.console_options)
         self.app.add_url_rule("/", None, self._index)
         self.app.add_url_rule("/submit", None, self._submit, methods=["POST"])
         self.app.add_url_rule("/init", None, self._init, methods=['GET'])
+        self.app.add_url_rule("/upload/<key>/init", None, self._upload_init, methods=['POST'])
+        self.app.add_url_rule("/upload/<upload_id>", None, self._upload_status, methods=['GET'])
+        self.app.add_url_rule("/upload/<upload_id>/<int:offset>", None, self._upload_part, methods=['PUT'])
+        self.app.add_url_rule("/upload/<upload_id>/finalize", None, self._upload_finalize, methods=['POST'])
+        self.app.add_url_rule("/options/<key>", None, self._options, methods=['GET'])
+        self.app.add_url_rule("/table/<key>", None, self._table, methods=['GET'])
+        self.app.add_url_rule("/task/<task_id>", None, self._task, methods=['GET'])
+        self.app.add_url_rule("/task/<task_id>/cancel", None, self._cancel, methods=['POST'])
+        if self.metrics.enabled:
+            self.app.add_url_rule("/metrics", None, self._metrics, methods=['GET'])
+        if self.history_enabled:
+            if self.history is None:
+                # workers share the database, the master recovered it before forking
+                self.history = self._open_history(recover=client_manager is None)
+            self.io.on_close(self.history.close)
+            self.app.add_url_rule("/history", None, self._history, methods=['GET'])
+            self.app.add_url_rule("/history/<task_id>", None, self._history_task, methods=['GET'])
+
+        self.executor = TaskExecutor(self.io, on_complete=self._on_task_complete,
+                                     mode=self.executor_mode, max_workers=self.workers,
+                                     on_output=self._on_task_output,
+                                     handlers={"table": self._on_task_table})
+        self.io.on("task:cancel", self._on_cancel_event)
+        self.io.on_connect(self._on_connect)
+        self._pushed = deepcopy(self._schema.get().data)
+
+    def run(self, port: int = 9030, flags: str = "", startup_report: bool = False,
+            listener=None, debug_port: int = None, headless: bool = False, host: str = "127.0.0.1",
+            processes: int = 1):
+        """
+
+        :param port:
+        :param flags: extra chrome flags
+        :param startup_report: print startup phase timings and save them to workspace/startup.json
+        :param listener: bound and listening socket to serve on, default: inherited from
+            VEFUI_LISTEN_FD or bound to host:port
+        :param debug_port: remote debugging port, a chrome already running with it is reused
+        :param headless: serve without a browser and keep running when clients disconnect,
+            e.g. behind a reverse proxy
+        :param host: interface to bind, e.g. 0.0.0.0 in headless mode
+        :param processes: worker processes sharing the socket, headless only, without
+            upload_store_size and metrics. see vefui.workers
+        """
+        if processes > 1 and not headless:
+            raise ValueError("processes > 1 requires headless=True")
+        if processes > 1 and self.blobs.max_size is not None:
+            # a worker only knows the uploads its own tasks use, it would evict those of others
+            raise ValueError("upload_store_size is not supported with processes > 1")
+        if processes > 1 and self.metrics.enabled:
+            # every worker counts its own requests, a scrape would read one of them
+            raise ValueError("metrics are not supported with processes > 1")
+        self.startup_report = startup_report
+        self.headless = headless
+        with self.startup.phase("bind"):
+            listener = listener or brw.inherited_listener() or brw.bind(host, port)
+            host, port = listener.getsockname()[:2]
+        if not headless:
+            # chrome starts while the server is built, its first request waits in the listen backlog
+            self._launch(host, port, flags, debug_port)
+        with self.startup.phase("import server"):
+            # imported here so building the form stays cheap
+            from engineio.async_drivers import gevent
+            import vefui.app
+        if processes > 1:
+            from vefui.workers import Master
+            if self.history_enabled:
+                self._open_history().close()
+            self.startup.mark("serving")
+            Master(listener, processes, self._serve_worker).run()
+            return
+        with self.startup.phase("create app"):
+            self._create_app()
+        self.startup.mark("serving")
+        self.io.serve(listener)
+
+    def _serve_worker(self, index: int, handoff, bus: list):
+        from vefui.workers import BusManager, serve_worker, sticky
+        self._create_app(client_manager=BusManager(bus, index))
+        self.app.after_request(sticky(index))
+        serve_worker(handoff, self.app, log=self.debug)
 
+    def _launch(self, host: str, port: int, flags: str, debug_port: int = None):
+        if host in ("0.0.0.0", ""):
+            host = "127.0.0.1"
         run_flags = [
             "--window-position={},{}".format(*self.position),
             "--window-size={},{}".format(*self.size),
             "--new-window",
-            "--user-data-dir={}".format(self.workspace.joinpath("chrome").absolute()),
+            "--user-data-dir={}".format(self.chrome_path.absolute()),
             "--disable-windows10-custom-titlebar",
             "-–disable-new-menu-style",
             flags
@@ -174,11 +928,13 @@ class VefUI:
 
         brw_options = {
             "chromeFlags": run_flags,
-            "mode": "chrome-app"
+            "mode": "chrome-app",
+            "cache": self.chrome_path.joinpath("vefui-launcher.json"),
+            "debugPort": debug_port
         }
 
-        brw.run(options=brw_options, start_urls=['http://127.0.0.1:{}'.format(port)])
-        self.io.run(port=port)
+        with self.startup.phase("launch browser"):
+            brw.run(options=brw_options, start_urls=['http://{}:{}'.format(host, port)])
 
 
 if __name__ == "__main__":
@@ -6,6 +6,10 @@ import pkg_resources as pkg
 import PyInstaller.__main__ as pyi
 import os
 from argparse import ArgumentParser
+from pathlib import Path
+from vefui.assets import precompress, pack, ARCHIVE_NAME
+import shutil
+import tempfile
 
 parser = ArgumentParser(description="""
 Vle is a little Python library for making simple Electron-like offline HTML/JS GUI apps,
@@ -21,6 +25,18 @@ parser.add_argument(
     type=str,
     help="Folder including all web files including file as html, css, ico, etc."
 )
+parser.add_argument(
+    "--profile",
+    choices=["onefile", "onedir"],
+    default="onefile",
+    help="onefile: single executable, unpacked to a temp dir on every launch; "
+         "onedir: a folder with the executable, nothing is unpacked so it starts faster"
+)
+parser.add_argument(
+    "--archive",
+    action="store_true",
+    help="pack the web folder into one indexed archive, served from memory at runtime"
+)
 args, unknown_args = parser.parse_known_args()
 main_script = args.main_script
 web_folder = args.web_folder
@@ -28,16 +44,36 @@ web_folder = args.web_folder
 print("Building executable with main script '%s' and web folder '%s'...\n" %
       (main_script, web_folder))
 
-web_folder_arg = '%s%s%s' % (web_folder, os.pathsep, web_folder)
+# ship .gz / .br next to the assets so the app does not compress them at launch,
+# written into a copy, the source folder is left as it is
+build_folder = Path(tempfile.mkdtemp(prefix="vefui-build-")).joinpath(Path(web_folder).resolve().name or "web")
+shutil.copytree(web_folder, str(build_folder))
+precompress(build_folder)
+web_folder_arg = '%s%s%s' % (build_folder, os.pathsep, web_folder)
+
+if args.archive:
+    # one data file instead of a tree, vefui.app maps it from the package folder
+    archive = pack(build_folder, build_folder.parent.joinpath(ARCHIVE_NAME))
+    web_folder_arg = '%s%s%s' % (archive, os.pathsep, 'vefui')
 
 # -n --name
 
-needed_args = ['-F',
-               '--noconsole',
-               '--name=count',
-               '--hidden-import', 'gevent',
-               # '--add-data', js_file_arg,
-               '--add-data', web_folder_arg]
+profile_args = {
+    "onefile": ['-F'],
+    # no upx: decompressing the binaries costs more at launch than it saves on disk
+    "onedir": ['-D', '--noupx'],
+}
+
+needed_args = profile_args[args.profile] + [
+    '--noconsole',
+    '--name=count',
+    '--hidden-import', 'gevent',
+    # imported lazily by VefUI.run
+    '--hidden-import', 'engineio.async_drivers.gevent',
+    '--hidden-import', 'vefui.app',
+    # '--add-data', js_file_arg,
+    '--add-data', web_folder_arg
+]
 full_args = [main_script] + needed_args + unknown_args
 print('Running:\npyinstaller', ' '.join(full_args), '\n')
 
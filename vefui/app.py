@@ -3,89 +3,413 @@
 # @Author : zander
 # @Time : 2021/2/20 14:14
 import os
+import socket
+import threading
+import uuid
+from collections import deque
 import flask
+import gevent as gvt
 from flask import Flask
-from flask_socketio import SocketIO, Namespace
-from dataclasses import dataclass
+from flask_socketio import SocketIO, Namespace, join_room
+from vefui.session import SessionStore, SESSION_KEY
+from vefui.assets import AssetServer, WebArchive, ARCHIVE_NAME
+from vefui.result import Result, RESULT_CHUNK_SIZE
+from vefui.metrics import Metrics, NullMetrics
+from jinja2 import DictLoader
+from pathlib import Path
+from typing import Optional
+from functools import lru_cache
 import json
 
 
-@dataclass()
-class Client:
+class ConsoleNameSpace(Namespace):
 
-    _sid: str = ""
-    _nsp: str = ""
+    def __init__(self, namespace: str, sessions: SessionStore, debug: bool = False, exit_on_close: bool = None,
+                 close_delay: float = 5.0):
+        """
 
-    @property
-    def sid(self):
-        return self._sid
+        :param debug:
+        :param exit_on_close: exit when the last client disconnects, default: when not debug
+        :param close_delay: seconds a dropped client has to reconnect before the process exits
+        """
+        super().__init__(namespace=namespace)
+        self.sessions = sessions
+        self.debug = debug
+        self.exit_on_close = not debug if exit_on_close is None else exit_on_close
+        self.close_delay = close_delay
+        self.connect_listeners = []
+        self.close_listeners = []
 
-    @sid.setter
-    def sid(self, value):
-        self._sid = value
+    def on_connect(self):
+        session = self.sessions.bind(flask.request.sid, flask.session.get(SESSION_KEY, None))
+        join_room(session.id)
+        for listener in self.connect_listeners:
+            listener(session)
 
-    @property
-    def nsp(self):
-        return self._nsp
+    def on_disconnect(self):
+        self.sessions.unbind(flask.request.sid)
+        if self.exit_on_close and not self.sessions.clients:
+            # a dropped socket reconnects in time, a closed window does not
+            gvt.spawn_later(self.close_delay, self._close)
 
-    @nsp.setter
-    def nsp(self, value):
-        self._nsp = value
+    def _close(self):
+        if self.sessions.clients:
+            return
+        # last window closed
+        for listener in self.close_listeners:
+            listener()
+        os._exit(0)
 
+    def on_test(self, data):
+        print(data)
 
-SingletonClient: Client = Client()
 
+class ConsoleBuffer:
+    """
+    merge console messages into batched frames, at most one frame per
+    interval and batch_size lines. every target keeps its newest capacity
+    lines, older ones are dropped and counted for that target only.
+    """
 
-class ConsoleNameSpace(Namespace):
+    def __init__(self, emit, interval: float = 0.05,
+                 batch_size: int = 1000, capacity: int = 10000):
+        self.emit = emit
+        self.interval = interval
+        self.batch_size = batch_size
+        self.capacity = capacity
+        self.dropped = {}
+        self.dropped_total = 0
+        self.total = 0
+        # [to, language, message] in put order, message None once dropped
+        self._lines = deque()
+        self._rings = {}
+        self._size = 0
+        self._lock = threading.Lock()
 
-    def __init__(self, namespace: str, debug: bool = False):
-        super().__init__(namespace=namespace)
-        self.debug = debug
+    def __len__(self):
+        return self._size
 
-    def on_connect(self):
-        global SingletonClient
-        SingletonClient.sid = flask.request.sid
-        SingletonClient.nsp = flask.request.namespace
+    def put(self, language: str, message: str, to: str = None) -> bool:
+        """
+        :return: True if the buffer was empty, the caller schedules a flush
+        """
+        line = [to, language, message]
+        with self._lock:
+            empty = not self._size
+            ring = self._rings.setdefault(to, deque())
+            if len(ring) >= self.capacity:
+                ring.popleft()[2] = None
+                self.dropped[to] = self.dropped.get(to, 0) + 1
+                self.dropped_total += 1
+                self._size -= 1
+                if len(self._lines) > 2 * self._size + self.capacity:
+                    self._lines = deque(item for item in self._lines if item[2] is not None)
+            ring.append(line)
+            self._lines.append(line)
+            self._size += 1
+            self.total += 1
+        return empty
 
-    def on_disconnect(self):
-        global SingletonClient
-        self.disconnect(SingletonClient.sid, SingletonClient.nsp)
+    def flush(self):
+        with self._lock:
+            lines, self._lines = self._lines, deque()
+            dropped, self.dropped = self.dropped, {}
+            self._rings, self._size = {}, 0
+        for to, count in dropped.items():
+            self.emit("console", {"language": "", "message": "... {} messages dropped".format(count)}, to)
+        frame, target, language = [], None, None
+        for to, lang, message in lines:
+            if message is None:
+                continue
+            if frame and (to != target or lang != language or len(frame) >= self.batch_size):
+                self.emit("console", {"language": language, "message": "\n".join(frame)}, target)
+                frame = []
+            frame.append(message)
+            target, language = to, lang
+        if frame:
+            self.emit("console", {"language": language, "message": "\n".join(frame)}, target)
 
-    def on_test(self, data):
-        print(data)
 
-    def disconnect(self, sid, namespace=None):
-        super().disconnect(sid, namespace)
-        if not self.debug:
-            os._exit(0)
+class ReplayLog:
+    """
+    the newest emitted frames, numbered, sent again to a client that reconnects.
+    only used on the hub, no lock. with worker processes each worker numbers and keeps
+    the frames it emits, frames from other workers reach its clients without seq.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        # a restarted process starts another stream, clients drop what they had seen
+        self.id = uuid.uuid4().hex
+        self.seq = 0
+        self._frames = deque(maxlen=capacity)
+
+    def add(self, event: str, data: dict, to: str = None) -> dict:
+        """
+        :return: data with its seq
+        """
+        self.seq += 1
+        data = dict(data, seq=self.seq)
+        self._frames.append((self.seq, event, data, to))
+        return data
+
+    def since(self, seq: int, room: str = None) -> dict:
+        """
+        frames after seq sent to room or to everyone
+        :return: {"stream", "seq", "complete": False if some were dropped, "frames": [{"event", "data"}]}
+        """
+        complete = not self._frames or self._frames[0][0] <= seq + 1
+        frames = [{"event": event, "data": data} for n, event, data, to in self._frames
+                  if n > seq and (to is None or to == room)]
+        return {"stream": self.id, "seq": self.seq, "complete": complete, "frames": frames}
 
 
 class IOApp:
 
-    def __init__(self, app, debug: bool = False):
+    def __init__(self, app, debug: bool = False,
+                 exit_on_close: bool = None,
+                 console_interval: float = 0.05,
+                 console_capacity: int = 10000,
+                 replay_capacity: int = 1000,
+                 close_delay: float = 5.0,
+                 metrics: Metrics = None,
+                 client_manager=None):
+        """
+
+        :param replay_capacity: frames kept to replay to a reconnecting client, results aside
+        :param close_delay: seconds a dropped client has to reconnect before the process exits
+        :param client_manager: socket.io client manager shared by worker processes, see vefui.workers
+        """
         self.app = app
         socket_io = SocketIO()
-        socket_io.init_app(app)
-        socket_io.on_namespace(ConsoleNameSpace("/console", debug=debug))
+        if client_manager is not None:
+            socket_io.init_app(app, client_manager=client_manager)
+        else:
+            socket_io.init_app(app)
+        self.sessions = SessionStore()
+        self.namespace = ConsoleNameSpace("/console", self.sessions, debug=debug, exit_on_close=exit_on_close,
+                                          close_delay=close_delay)
+        socket_io.on_namespace(self.namespace)
+        self.replay = ReplayLog(replay_capacity)
+        self.namespace.connect_listeners.append(self._replay_on_connect)
         self.io = socket_io
+        self._thread = threading.get_ident()
+        self._loop = gvt.get_hub().loop
+        self._sink = None
+        self._result_sink = None
+        self.buffer = ConsoleBuffer(self._emit, interval=console_interval, capacity=console_capacity)
+        self.metrics = metrics or NullMetrics()
+        self._emits = self.metrics.counter("vefui_emit_total", "events sent, console lines aside", ("event",))
+        self.metrics.gauge("vefui_console_lines_total", "console lines queued", lambda: self.buffer.total, kind="counter")
+        self.metrics.gauge("vefui_console_buffer", "console lines waiting to be sent", lambda: len(self.buffer))
+        self.metrics.gauge("vefui_console_dropped_total", "console lines dropped by a full buffer",
+                           lambda: self.buffer.dropped_total, kind="counter")
+        self.metrics.gauge("vefui_sockets", "open socket.io connections", lambda: self.sessions.clients)
+        self.metrics.gauge("vefui_sessions", "browser sessions", lambda: len(self.sessions))
+        self.on("replay", self._on_replay)
 
     def run(self, port: int = 9030):
         self.io.run(self.app, host="127.0.0.1", port=port)
 
-    def send(self, message, language: str = "",  event: str = "console"):
+    def serve(self, listener):
+        """
+        serve on an already bound socket
+        """
+        serve(listener, self.app, log=self.app.debug)
+
+    def has_client(self, sid: str) -> bool:
+        """
+        :param sid: engine.io session id, the sid argument of /socket.io requests
+        """
+        return sid in self.io.server.eio.sockets
+
+    def on(self, event: str, handler):
+        """
+        register a client event handler on /console
+        """
+        self.io.on_event(event, handler, namespace="/console")
+
+    def on_connect(self, listener):
+        """
+        call listener(session) when a client connects
+        """
+        self.namespace.connect_listeners.append(listener)
+
+    def on_close(self, listener):
+        """
+        call listener() before the process exits because the last window closed
+        """
+        self.namespace.close_listeners.append(listener)
+
+    def redirect(self, sink, result_sink=None):
+        """
+        send messages to sink(message, language, event, to, local) instead of the socket,
+        used by process workers
+        :param result_sink: receives send_result arguments
+        """
+        self._sink = sink
+        self._result_sink = result_sink
+
+    def send_result(self, data, name: str = None, mimetype: str = None, to: str = None,
+                    chunk_size: int = RESULT_CHUNK_SIZE) -> str:
+        """
+        send data as binary frames on the result event, see vefui.result
+        :param data: bytes like, numpy array, str, or anything msgpack / json can encode.
+            buffers are read while the frames go out, do not change them until then
+        :return: result id
+        """
+        if self._result_sink is not None:
+            if isinstance(data, memoryview):
+                data = data.tobytes()
+            self._result_sink(data, name, mimetype, to, chunk_size)
+            return ""
+        result = Result(data, name, mimetype, chunk_size)
+        self._emits.inc(result.chunks, "result")
+        # one hub callback per frame, the hub keeps serving between them
+        self._dispatch(self._flush_emit, "result", result.frame(0), to)
+        for seq in range(1, result.chunks):
+            self._dispatch(self._emit_frame, result, seq, to)
+        return result.id
+
+    def _emit_frame(self, result: Result, seq: int, to: str = None):
+        self._emit("result", result.frame(seq), to)
+
+    def send(self, message, language: str = "",  event: str = "console", to: str = None, local: bool = False):
+        """
+        :param to: session id, None broadcasts to every client
+        :param local: only to clients of this process, not over the worker bus. for events about
+            state only this process has, e.g. schema patches
+        """
+        if self._sink is not None:
+            self._sink(message, language, event, to, local)
+            return
         if not isinstance(message, str):
             message = json.dumps(message)
-        self.io.emit(event, {"language": language, "message": message},
-                     namespace=SingletonClient.nsp, to=SingletonClient.sid)
+        if event == "console":
+            if self.buffer.put(language, message, to):
+                self._dispatch(gvt.spawn_later, self.buffer.interval, self.buffer.flush)
+            elif len(self.buffer) == self.buffer.batch_size:
+                self._dispatch(self.buffer.flush)
+            return
+        self._emits.inc(1, event)
+        # keep order: buffered console lines go out before other events
+        self._dispatch(self._flush_emit, event, {"language": language, "message": message}, to, local)
+
+    def flush(self, timeout: float = None):
+        """
+        send buffered console messages now, worker threads wait until they are out
+        """
+        if self._sink is not None:
+            return
+        if threading.get_ident() == self._thread:
+            self.buffer.flush()
+            return
+        done = threading.Event()
+        self._loop.run_callback_threadsafe(lambda: (self.buffer.flush(), done.set()))
+        done.wait(timeout)
+
+    def _dispatch(self, func, *args):
+        if threading.get_ident() != self._thread:
+            # worker threads hand the emit over to the hub
+            self._loop.run_callback_threadsafe(func, *args)
+        else:
+            func(*args)
+
+    def _flush_emit(self, event: str, data: dict, to: str = None, local: bool = False):
+        self.buffer.flush()
+        self._emit(event, data, to, local)
+
+    def _emit(self, event: str, data: dict, to: str = None, local: bool = False):
+        if event != "result":
+            # result frames are too large to keep
+            data = self.replay.add(event, data, to)
+        self.io.emit(event, data, namespace="/console", to=to, ignore_queue=local)
+
+    def _replay_on_connect(self, session):
+        # io(url, {query: {seq: <last seen>}})
+        seq = flask.request.args.get("seq", "")
+        if seq.isdigit():
+            self._replay(session, int(seq))
+
+    def _on_replay(self, data):
+        session = self.sessions.by_sid(flask.request.sid)
+        if session is not None:
+            self._replay(session, int((data or {}).get("seq", 0)))
+
+    def _replay(self, session, seq: int):
+        """
+        send what a client missed since seq in one replay event, buffered lines follow live
+        """
+        self.io.emit("replay", self.replay.since(seq, session.id), namespace="/console", to=flask.request.sid)
+
+
+def serve(listener, wsgi_app, log: bool = False, server_class=None):
+    """
+    serve a wsgi app with gevent on an already bound socket
+    :param server_class: pywsgi.WSGIServer subclass
+    """
+    from gevent import pywsgi
+    server_class = server_class or pywsgi.WSGIServer
+    options = {}
+    try:
+        from geventwebsocket.handler import WebSocketHandler
+        options["handler_class"] = WebSocketHandler
+    except ImportError:
+        # socket.io falls back to long polling
         pass
+    # gevent waits on the listener, it must not block the hub
+    listener.setblocking(False)
+    if listener.family in (socket.AF_INET, socket.AF_INET6):
+        # accepted sockets inherit it: no nagle wait between headers and body
+        listener.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    server = server_class(listener, wsgi_app, log="default" if log else None, **options)
+    server.serve_forever()
+
+
+@lru_cache(maxsize=None)
+def _archive() -> Optional[WebArchive]:
+    archive_path = Path(__file__).parent.joinpath(ARCHIVE_NAME)
+    if archive_path.exists():
+        return WebArchive(archive_path)
+    return None
+
+
+def load_assets(asset_cache: Path = None) -> AssetServer:
+    """
+    web bundle assets, compressed in the background. one server can be shared by many apps
+    """
+    archive = _archive()
+    if archive is not None:
+        assets = AssetServer.from_archive(archive, cache_dir=asset_cache)
+    else:
+        assets = AssetServer(Path(__file__).parent.joinpath("web", "assets"), cache_dir=asset_cache)
+    assets.prepare()
+    return assets
+
+
+def create_app(debug: bool = False, asset_cache: Path = None, assets: AssetServer = None, secret_key: bytes = None,
+               **io_options):
+    """
 
+    :param debug:
+    :param asset_cache: folder keeping assets compressed at startup
+    :param assets: shared assets, loaded for this app by default
+    :param secret_key: signs the session cookie, random by default. worker processes must share it
+    :param io_options: IOApp options
+    """
+    archive = _archive()
+    if archive is not None:
+        # packaged app: everything is served from the mapped archive
+        app = Flask(__name__, template_folder=None, static_folder=None)
+        app.jinja_env.loader = DictLoader({"index.html": archive.text("index.html")})
+    else:
+        app = Flask(__name__, template_folder="web", static_folder=None)
 
-def create_app(debug: bool = False):
-    app = Flask(__name__, template_folder="web", static_folder="web/assets")
+    app.config['SECRET_KEY'] = secret_key or os.urandom(32)
 
-    app.config['SECRET_KEY'] = 'secret!'
+    assets = assets or load_assets(asset_cache)
+    app.add_url_rule("/assets/<path:filename>", "static", assets.response)
 
-    io = IOApp(app, debug=debug)
+    io = IOApp(app, debug=debug, **io_options)
 
     return app, io
 
@@ -0,0 +1,255 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/4/23 14:10
+import gzip
+import hashlib
+import json
+import mimetypes
+import mmap
+import os
+import re
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# vite names bundles like index.8461aaa6.js
+HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.\w+$")
+COMPRESSIBLE = {".js", ".css", ".html", ".svg", ".json", ".map", ".txt", ".ttf", ".ico"}
+MIN_COMPRESS_SIZE = 1024
+# bytes per write, memoryview slices of the mapping are sent without copying
+SEND_BLOCK = 256 * 1024
+MIME_TYPES = {
+    ".js": "application/javascript",
+    ".css": "text/css",
+    ".woff": "font/woff",
+    ".ttf": "font/ttf",
+    ".ico": "image/x-icon"
+}
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+# web archive: magic, index length, json index {name: [offset, size]}, file data
+ARCHIVE_MAGIC = b"VFA1"
+ARCHIVE_HEADER = struct.Struct("<4sI")
+ARCHIVE_NAME = "web.vfa"
+
+
+def _compress(data, encoding: str) -> Optional[bytes]:
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=9)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(bytes(data))
+    return None
+
+
+def precompress(folder: Path):
+    """
+    write .gz and .br files next to the compressible assets, run at build time
+    """
+    for path in Path(folder).rglob("*"):
+        if not path.is_file() or path.suffix not in COMPRESSIBLE:
+            continue
+        data = path.read_bytes()
+        if len(data) < MIN_COMPRESS_SIZE:
+            continue
+        for encoding, suffix in ENCODINGS.items():
+            target = path.with_name(path.name + suffix)
+            if target.exists() and target.stat().st_mtime >= path.stat().st_mtime:
+                continue
+            body = _compress(data, encoding)
+            if body is not None and len(body) < len(data) * 0.9:
+                target.write_bytes(body)
+
+
+def _map(path: Path):
+    with open(str(path), "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def pack(folder: Path, target: Path) -> Path:
+    """
+    pack a web folder, with its .gz / .br variants, into one archive
+    """
+    folder = Path(folder)
+    files = sorted(p for p in folder.rglob("*") if p.is_file())
+    index, offset = {}, 0
+    for path in files:
+        size = path.stat().st_size
+        index[path.relative_to(folder).as_posix()] = [offset, size]
+        offset += size
+    head = json.dumps(index, separators=(",", ":")).encode("utf-8")
+    with open(str(target), "wb") as f:
+        f.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, len(head)))
+        f.write(head)
+        for path in files:
+            with open(str(path), "rb") as src:
+                while True:
+                    block = src.read(SEND_BLOCK)
+                    if not block:
+                        break
+                    f.write(block)
+    return target
+
+
+class WebArchive:
+    """
+    a packed web folder mapped once, files are slices of the mapping
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._map = _map(path)
+        magic, size = ARCHIVE_HEADER.unpack_from(self._map, 0)
+        if magic != ARCHIVE_MAGIC:
+            raise ValueError("{} is not a web archive".format(path))
+        start = ARCHIVE_HEADER.size
+        index = json.loads(bytes(self._map[start:start + size]).decode("utf-8"))
+        view = memoryview(self._map)[start + size:]
+        self.files = {name: view[offset:offset + length] for name, (offset, length) in index.items()}
+
+    def text(self, name: str) -> str:
+        return bytes(self.files[name]).decode("utf-8")
+
+
+class Asset:
+
+    def __init__(self, name: str, body, variants: dict = None):
+        """
+
+        :param name: file name
+        :param body: file content, any buffer
+        :param variants: compressed bodies by encoding
+        """
+        self.name = name
+        self.suffix = os.path.splitext(name)[1]
+        self.immutable = HASHED_NAME.search(self.name) is not None
+        self.mimetype = MIME_TYPES.get(self.suffix, None) or mimetypes.guess_type(self.name)[0] \
+            or "application/octet-stream"
+        self.body = body
+        self.etag = hashlib.sha1(self.body).hexdigest()
+        self.variants: Dict[str, object] = variants or {}
+
+    @classmethod
+    def from_path(cls, path: Path):
+        variants = {}
+        for encoding, suffix in ENCODINGS.items():
+            variant = path.with_name(path.name + suffix)
+            if variant.exists():
+                variants[encoding] = _map(variant)
+        return cls(path.name, _map(path), variants)
+
+    @property
+    def compressible(self) -> bool:
+        return self.suffix in COMPRESSIBLE and len(self.body) >= MIN_COMPRESS_SIZE
+
+    def encoding(self, accept) -> Optional[str]:
+        best, quality = None, 0
+        for name in ENCODINGS:
+            q = accept[name]
+            if name in self.variants and q > quality:
+                best, quality = name, q
+        return best
+
+
+class AssetServer:
+    """
+    serve the web bundle from memory mapped files with precompressed variants.
+    hashed file names never change content, they are cached by the browser for good.
+    """
+
+    def __init__(self, folder: Path = None, cache_dir: Path = None, assets: Dict[str, Asset] = None):
+        """
+
+        :param folder: assets folder
+        :param cache_dir: keep variants compressed at startup here for the next launch
+        :param assets: assets by relative name, instead of reading folder
+        """
+        self.cache_dir = cache_dir
+        self.assets: Dict[str, Asset] = assets or {}
+        if folder is not None:
+            folder = Path(folder)
+            for path in folder.rglob("*"):
+                if path.is_file() and path.suffix not in (".gz", ".br"):
+                    self.assets[path.relative_to(folder).as_posix()] = Asset.from_path(path)
+
+    @classmethod
+    def from_archive(cls, archive: WebArchive, prefix: str = "assets/", cache_dir: Path = None):
+        assets = {}
+        for name, body in archive.files.items():
+            if not name.startswith(prefix) or os.path.splitext(name)[1] in (".gz", ".br"):
+                continue
+            variants = {encoding: archive.files[name + suffix]
+                        for encoding, suffix in ENCODINGS.items() if name + suffix in archive.files}
+            assets[name[len(prefix):]] = Asset(os.path.basename(name), body, variants)
+        return cls(cache_dir=cache_dir, assets=assets)
+
+    def prepare(self) -> threading.Thread:
+        """
+        compress assets that came without variants, off the hub; zlib releases the GIL
+        """
+        thread = threading.Thread(target=self._prepare, name="vefui-assets", daemon=True)
+        thread.start()
+        return thread
+
+    def _prepare(self):
+        for asset in list(self.assets.values()):
+            if not asset.compressible:
+                continue
+            for encoding, suffix in ENCODINGS.items():
+                if encoding in asset.variants:
+                    continue
+                cached = None
+                if self.cache_dir is not None:
+                    cached = self.cache_dir.joinpath("{}.{}{}".format(asset.etag, asset.name, suffix))
+                    if cached.exists():
+                        asset.variants[encoding] = _map(cached)
+                        continue
+                body = _compress(asset.body, encoding)
+                if body is None or len(body) >= len(asset.body) * 0.9:
+                    continue
+                if cached is not None:
+                    try:
+                        cached.parent.mkdir(parents=True, exist_ok=True)
+                        cached.write_bytes(body)
+                    except OSError:
+                        pass
+                asset.variants[encoding] = body
+
+    def response(self, filename: str):
+        from flask import Response, request, abort
+        asset = self.assets.get(filename, None)
+        if asset is None:
+            abort(404)
+        if request.if_none_match.contains(asset.etag):
+            response = Response(status=304)
+        else:
+            encoding = asset.encoding(request.accept_encodings)
+            body = asset.variants[encoding] if encoding is not None else asset.body
+            response = Response(self._blocks(body), mimetype=asset.mimetype, direct_passthrough=True)
+            response.content_length = len(body)
+            if encoding is not None:
+                response.headers["Content-Encoding"] = encoding
+        response.set_etag(asset.etag)
+        response.headers["Vary"] = "Accept-Encoding"
+        if asset.immutable:
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    @staticmethod
+    def _blocks(body):
+        view = memoryview(body)
+        for offset in range(0, len(view), SEND_BLOCK):
+            yield view[offset:offset + SEND_BLOCK]
+
+
+if __name__ == "__main__":
+    pass
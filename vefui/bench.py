@@ -0,0 +1,327 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/5/10 9:40
+"""
+load test a VefUI app served headless, results are printed as json.
+
+    python -m vefui.bench --requests 500 --concurrency 8 --upload-size 4194304
+"""
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List
+
+from vefui import VefUI
+from vefui import chrome as brw
+from vefui.form import Input, Upload
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+SCENARIOS = ("init", "submit", "upload", "console")
+
+
+def percentiles(samples: List[float]) -> dict:
+    samples = sorted(samples)
+    if not samples:
+        return {}
+
+    def at(p: float) -> float:
+        return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 3)
+    return {
+        "p50": at(0.5),
+        "p90": at(0.9),
+        "p99": at(0.99),
+        "max": round(samples[-1] * 1000, 3),
+        "mean": round(sum(samples) / len(samples) * 1000, 3)
+    }
+
+
+def peak_rss() -> int:
+    """
+    peak resident set size of this process in bytes, server and client together
+    """
+    if resource is None:
+        return -1
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on mac
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def multipart(fields: dict, files: dict = None):
+    """
+    :return: content type, body
+    """
+    boundary = uuid.uuid4().hex
+    parts = []
+    for key, value in fields.items():
+        parts.append('--{}\r\nContent-Disposition: form-data; name="{}"\r\n\r\n{}\r\n'
+                     .format(boundary, key, value).encode("utf-8"))
+    for key, (filename, data) in (files or {}).items():
+        parts.append('--{}\r\nContent-Disposition: form-data; name="{}"; filename="{}"\r\n'
+                     'Content-Type: application/octet-stream\r\n\r\n'
+                     .format(boundary, key, filename).encode("utf-8"))
+        parts.append(data)
+        parts.append(b"\r\n")
+    parts.append("--{}--\r\n".format(boundary).encode("utf-8"))
+    return "multipart/form-data; boundary={}".format(boundary), b"".join(parts)
+
+
+class Client:
+    """
+    one browser: a keep-alive connection and the session cookie
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.connection = http.client.HTTPConnection(host, port, timeout=60)
+        self.cookies = {}
+
+    def request(self, method: str, path: str, body: bytes = None, headers: dict = None):
+        headers = dict(headers or {})
+        if self.cookies:
+            headers["Cookie"] = "; ".join("{}={}".format(*item) for item in self.cookies.items())
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        data = response.read()
+        for cookie in response.headers.get_all("Set-Cookie") or []:
+            name, _, value = cookie.split(";", 1)[0].partition("=")
+            self.cookies[name.strip()] = value.strip()
+        if response.status >= 400:
+            raise RuntimeError("{} {}: {}".format(method, path, response.status))
+        return data
+
+    def open(self):
+        self.request("GET", "/")
+        return self
+
+    def close(self):
+        self.connection.close()
+
+
+class ConsoleClient:
+    """
+    socket.io over engine.io long polling, enough to count /console events
+    """
+
+    def __init__(self, client: Client):
+        self.client = client
+        opened = client.request("GET", "/socket.io/?EIO=4&transport=polling").decode("utf-8")
+        self.sid = json.loads(opened[1:])["sid"]
+        self.path = "/socket.io/?EIO=4&transport=polling&sid={}".format(self.sid)
+        client.request("POST", self.path, body=b"40/console,")
+
+    def events(self):
+        """
+        poll once, yield (event, data)
+        """
+        for packet in self.client.request("GET", self.path).decode("utf-8").split("\x1e"):
+            if packet == "2":
+                self.client.request("POST", self.path, body=b"3")
+            elif packet.startswith("42/console,"):
+                event, data = json.loads(packet[len("42/console,"):])[:2]
+                yield event, data
+
+
+class Bench:
+
+    def __init__(self, requests: int = 200, concurrency: int = 4, upload_size: int = 1024 * 1024,
+                 uploads: int = 20, console_lines: int = 20000, executor: str = "thread", workers: int = 1,
+                 metrics: bool = False):
+        """
+
+        :param requests: requests per scenario
+        :param concurrency: client threads
+        :param upload_size: bytes per uploaded file
+        :param uploads: number of uploads
+        :param console_lines: console messages sent by one submit
+        :param executor: VefUI executor
+        :param workers: VefUI workers
+        :param metrics: run with VefUI metrics on
+        """
+        self.requests = requests
+        self.concurrency = concurrency
+        self.upload_size = upload_size
+        self.uploads = uploads
+        self.console_lines = console_lines
+        # removed by close(), or when the bench is collected
+        self._workspace = tempfile.TemporaryDirectory(prefix="vefui-bench-")
+        self.workspace = Path(self._workspace.name)
+        self.app = self._create(executor, workers, metrics)
+        self.listener = brw.bind("127.0.0.1", 0)
+        self.host, self.port = self.listener.getsockname()[:2]
+
+    def _create(self, executor: str, workers: int, metrics: bool) -> VefUI:
+        app = VefUI("bench", workspace=self.workspace, executor=executor, workers=workers,
+                    console_capacity=max(10000, self.console_lines), metrics=metrics)
+        app.add(Input(key="name"))
+        app.add(Input(key="lines", is_number=True, required=False))
+        app.add(Upload(key="file", required=False))
+
+        @app.on_submit()
+        def submit():
+            for i in range(int(app.get_value("lines") or 0)):
+                app.console("line {}".format(i))
+
+        return app
+
+    def close(self):
+        """
+        close the listener and remove the workspace
+        """
+        self.listener.close()
+        self._workspace.cleanup()
+
+    def client(self) -> Client:
+        return Client(self.host, self.port).open()
+
+    def _load(self, total: int, call: Callable[[Client], None]) -> dict:
+        latencies = []
+        clients = [self.client() for _ in range(self.concurrency)]
+
+        def worker(client: Client, count: int):
+            for _ in range(count):
+                start = time.perf_counter()
+                call(client)
+                latencies.append(time.perf_counter() - start)
+
+        share = [total // self.concurrency + (i < total % self.concurrency) for i in range(self.concurrency)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            for future in [pool.submit(worker, c, n) for c, n in zip(clients, share)]:
+                future.result()
+        elapsed = time.perf_counter() - start
+        for client in clients:
+            client.close()
+        return {
+            "requests": total,
+            "seconds": round(elapsed, 4),
+            "throughput": round(total / elapsed, 2),
+            "latency_ms": percentiles(latencies)
+        }
+
+    def bench_init(self) -> dict:
+        return self._load(self.requests, lambda client: client.request("GET", "/init"))
+
+    def bench_submit(self) -> dict:
+        content_type, body = multipart({"name": "bench"})
+        headers = {"Content-Type": content_type}
+        return self._load(self.requests, lambda client: client.request("POST", "/submit", body, headers))
+
+    def bench_upload(self) -> dict:
+        content_type, body = multipart({"name": "bench"}, {"file": ("bench.bin", os.urandom(self.upload_size))})
+        headers = {"Content-Type": content_type}
+        result = self._load(self.uploads, lambda client: client.request("POST", "/submit", body, headers))
+        result["bytes_per_second"] = round(self.uploads * self.upload_size / result["seconds"], 2)
+        result["upload_size"] = self.upload_size
+        return result
+
+    def bench_console(self) -> dict:
+        client = self.client()
+        console = ConsoleClient(client)
+        # the namespace connect arrives first
+        list(console.events())
+        content_type, body = multipart({"name": "bench", "lines": self.console_lines})
+        start = time.perf_counter()
+        client.request("POST", "/submit", body, {"Content-Type": content_type})
+        lines, frames, done = 0, 0, False
+        while not done:
+            for event, data in console.events():
+                if event == "console":
+                    frames += 1
+                    lines += data["message"].count("\n") + 1
+                elif event == "task:complete":
+                    done = True
+        elapsed = time.perf_counter() - start
+        client.close()
+        return {
+            "lines": self.console_lines,
+            "received": lines,
+            "frames": frames,
+            "seconds": round(elapsed, 4),
+            "lines_per_second": round(lines / elapsed, 2)
+        }
+
+    def run(self, scenarios=SCENARIOS) -> dict:
+        results = {}
+        error = []
+
+        def drive():
+            try:
+                self.client().close()
+                # measure the steady state, after startup work such as asset compression
+                for thread in threading.enumerate():
+                    if thread.name == "vefui-assets":
+                        thread.join()
+                for name in scenarios:
+                    results[name] = getattr(self, "bench_" + name)()
+            except Exception as e:
+                error.append(e)
+
+        import gevent
+        server = gevent.spawn(self.app.run, listener=self.listener, headless=True)
+        driver = threading.Thread(target=drive, name="vefui-bench", daemon=True)
+        driver.start()
+        # the hub is not monkey patched, poll instead of join
+        while driver.is_alive():
+            gevent.sleep(0.05)
+        server.kill()
+        if error:
+            raise error[0]
+        return {
+            "python": sys.version.split()[0],
+            "platform": sys.platform,
+            "concurrency": self.concurrency,
+            "executor": self.app.executor_mode,
+            "workers": self.app.workers,
+            "metrics": self.app.metrics.enabled,
+            "scenarios": results,
+            "peak_rss": peak_rss()
+        }
+
+
+def main(argv=None):
+    parser = ArgumentParser(prog="python -m vefui.bench", description="load test a headless VefUI app")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="client threads")
+    parser.add_argument("--upload-size", type=int, default=1024 * 1024, help="bytes per uploaded file")
+    parser.add_argument("--uploads", type=int, default=20, help="number of uploads")
+    parser.add_argument("--console-lines", type=int, default=20000, help="console messages sent by one submit")
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--metrics", action="store_true", help="run with VefUI metrics on")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma separated, from: {}".format(", ".join(SCENARIOS)))
+    parser.add_argument("--output", type=Path, default=None, help="also write the json report here")
+    args = parser.parse_args(argv)
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    for name in scenarios:
+        if name not in SCENARIOS:
+            parser.error("unknown scenario {}".format(name))
+
+    bench = Bench(requests=args.requests, concurrency=args.concurrency, upload_size=args.upload_size,
+                  uploads=args.uploads, console_lines=args.console_lines,
+                  executor=args.executor, workers=args.workers, metrics=args.metrics)
+    try:
+        text = json.dumps(bench.run(scenarios), indent=2)
+    finally:
+        bench.close()
+    print(text)
+    if args.output is not None:
+        args.output.write_text(text)
+
+
+if __name__ == "__main__":
+    main()
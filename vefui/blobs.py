@@ -0,0 +1,205 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/5/27 10:20
+import os
+import sqlite3
+import stat
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    checksum TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blobs_used ON blobs (used);
+CREATE TABLE IF NOT EXISTS links (
+    path TEXT PRIMARY KEY,
+    checksum TEXT NOT NULL,
+    filename TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS links_checksum ON links (checksum);
+"""
+# temp files older than this are left over by a crash
+STALE_TEMP = 24 * 3600
+READ_ONLY = stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except PermissionError:
+        # windows does not remove read-only files
+        os.chmod(path, READ_ONLY | stat.S_IWUSR)
+        os.unlink(path)
+
+
+class BlobStore:
+    """
+    uploaded files kept once by sha256, hard linked to the name of every upload.
+    an upload of known content is not stored again, the least recently used blobs
+    are evicted beyond max_size. blobs are read-only, every link shares the same inode.
+    """
+
+    def __init__(self, root: Path, max_size: int = None, pinned: Callable[[], Iterable[str]] = None):
+        """
+
+        :param root: blobs, temp files and index.db
+        :param max_size: bytes kept, None is unlimited
+        :param pinned: pinned() -> checksums in use, never evicted
+        """
+        self.root = root
+        self.max_size = max_size
+        self.pinned = pinned
+        self.tmp = root.joinpath("tmp")
+        self._lock = threading.Lock()
+        self._pid = None
+        self._connection = None
+
+    def _db(self) -> sqlite3.Connection:
+        # opened on first use, a forked worker opens its own connection
+        if self._pid != os.getpid():
+            if self._connection is None:
+                self.tmp.mkdir(parents=True, exist_ok=True)
+                self._clean()
+            self._connection = sqlite3.connect(str(self.root.joinpath("index.db")), timeout=30,
+                                               check_same_thread=False, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._connection
+
+    def _clean(self):
+        deadline = time.time() - STALE_TEMP
+        for path in self.tmp.iterdir():
+            try:
+                if path.stat().st_mtime < deadline:
+                    path.unlink()
+            except OSError:
+                pass
+
+    def temp(self) -> Path:
+        """
+        path to receive an upload into, before its checksum is known
+        """
+        with self._lock:
+            self._db()
+        return self.tmp.joinpath(uuid.uuid4().hex)
+
+    def blob_path(self, checksum: str) -> Path:
+        return self.root.joinpath(checksum[:2], checksum)
+
+    def get(self, checksum: str, size: int = None) -> Optional[Path]:
+        """
+        :return: blob with checksum and size, None if it is not stored
+        """
+        if len(checksum) != 64 or not all(c in "0123456789abcdef" for c in checksum):
+            return None
+        with self._lock:
+            row = self._db().execute("SELECT size FROM blobs WHERE checksum = ?", (checksum,)).fetchone()
+        path = self.blob_path(checksum)
+        if row is None or (size is not None and row[0] != size) or not path.exists():
+            return None
+        return path
+
+    def add(self, path: Path, checksum: str, size: int, target: Path) -> Path:
+        """
+        store a received file once, a duplicate is removed.
+        :param path: received file, moved or removed
+        :param target: name of the upload
+        :return: target linked to the blob
+        """
+        blob = self.blob_path(checksum)
+        if self.get(checksum, size) is not None:
+            path.unlink()
+        else:
+            blob.parent.mkdir(exist_ok=True)
+            # a callback writing to its upload must not change the copies of other sessions
+            os.chmod(str(path), READ_ONLY)
+            os.replace(str(path), str(blob))
+            with self._lock:
+                self._db().execute("INSERT OR REPLACE INTO blobs (checksum, size, used) VALUES (?, ?, ?)",
+                                   (checksum, size, time.time()))
+        return self.link(checksum, target)
+
+    def link(self, checksum: str, target: Path) -> Path:
+        """
+        give a stored blob the name of an upload
+        :return: target, or the blob itself where hard links are not supported
+        """
+        blob = self.blob_path(checksum)
+        if target.exists() or target.is_symlink():
+            _unlink(str(target))
+        try:
+            os.link(str(blob), str(target))
+        except OSError:
+            target = blob
+        with self._lock:
+            db = self._db()
+            db.execute("UPDATE blobs SET used = ? WHERE checksum = ?", (time.time(), checksum))
+            if target != blob:
+                db.execute("INSERT OR REPLACE INTO links (path, checksum, filename) VALUES (?, ?, ?)",
+                           (str(target), checksum, target.name))
+        self.evict(keep=checksum)
+        return target
+
+    def unlink(self, target: Path):
+        """
+        remove the name of an upload, the blob stays
+        """
+        try:
+            _unlink(str(target))
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self._db().execute("DELETE FROM links WHERE path = ?", (str(target),))
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return self._db().execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def evict(self, keep: str = None):
+        """
+        remove the least recently used blobs and their links until the store fits max_size
+        :param keep: checksum never evicted, the blob just used
+        """
+        if self.max_size is None:
+            return
+        with self._lock:
+            db = self._db()
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total <= self.max_size:
+                return
+            # files of pending and running tasks and of current session values stay
+            pinned = set(self.pinned()) if self.pinned is not None else set()
+            pinned.add(keep)
+            for checksum, size in db.execute("SELECT checksum, size FROM blobs ORDER BY used").fetchall():
+                if total <= self.max_size:
+                    break
+                if checksum in pinned:
+                    continue
+                blob = self.blob_path(checksum)
+                for (link,) in db.execute("SELECT path FROM links WHERE checksum = ?", (checksum,)).fetchall():
+                    try:
+                        # the name may have been given to another upload since
+                        if os.path.samefile(link, str(blob)):
+                            _unlink(link)
+                    except OSError:
+                        pass
+                try:
+                    _unlink(str(blob))
+                except OSError:
+                    pass
+                db.execute("DELETE FROM links WHERE checksum = ?", (checksum,))
+                db.execute("DELETE FROM blobs WHERE checksum = ?", (checksum,))
+                total -= size
+
+
+if __name__ == "__main__":
+    pass
@@ -1,21 +1,123 @@
 import os
 import sys
+import json
+import shutil
+import socket
 import subprocess as sps
+from urllib import request as urq
+from urllib.parse import quote
 
 # chrome.exe --window-size=960,720 --new-window --app=http://127.0.0.1:9020 --user-data-dir="D:\sec"
 # --disable-windows10-custom-titlebar 统一色彩
 
+# resolved chrome path, per process
+_instance_path = None
+
+
+def bind(host: str = "127.0.0.1", port: int = 9030, backlog: int = 128) -> socket.socket:
+    """
+    bind the server socket before chrome starts, connections wait in the backlog
+    until the server accepts them, so the first page load never fails.
+    """
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if sys.platform not in ['win32', 'win64']:
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(backlog)
+    return listener
+
+
+def inherited_listener(env: str = "VEFUI_LISTEN_FD"):
+    """
+    listening socket passed in by a parent process as a file descriptor
+    """
+    fd = os.environ.get(env, None)
+    if not fd:
+        return None
+    return socket.socket(fileno=int(fd))
+
+
+def _devtools(port: int, path: str, method: str = "GET", timeout: float = 0.5):
+    req = urq.Request("http://127.0.0.1:{}{}".format(port, path), method=method)
+    with urq.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read().decode("utf-8") or "null")
+
+
+def reuse(debug_port: int, url: str) -> bool:
+    """
+    show url in an already running chrome through its remote debugging port
+    :return: False if no chrome listens on the port
+    """
+    try:
+        targets = _devtools(debug_port, "/json/list")
+    except (OSError, ValueError):
+        return False
+    for target in targets:
+        if target.get("type") == "page" and target.get("url", "").startswith(url):
+            try:
+                _devtools(debug_port, "/json/activate/{}".format(target["id"]))
+            except (OSError, ValueError):
+                return False
+            return True
+    try:
+        _devtools(debug_port, "/json/new?{}".format(quote(url, safe="")), method="PUT")
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def _load_cache(path):
+    if path is None or not os.path.exists(str(path)):
+        return {}
+    try:
+        with open(str(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(path, data):
+    if path is None:
+        return
+    try:
+        os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+        with open(str(path), "w") as f:
+            json.dump(data, f)
+    except OSError:
+        pass
+
 
 def run(options, start_urls):
-    chrome_path = get_instance_path()
+    """
+
+    :param options:
+        :param options -> chromeFlags: list of chrome flags
+        :param options -> mode: chrome-app | other
+        :param options -> cache: json file caching the resolved chrome path
+        :param options -> debugPort: reuse a chrome started with this remote debugging port
+    :param start_urls:
+    """
+    cache_file = options.get("cache", None)
+    debug_port = options.get("debugPort", None)
+    flags = [f for f in options['chromeFlags'] if f]
+    if debug_port:
+        if all(reuse(debug_port, url) for url in start_urls):
+            return
+        flags.append("--remote-debugging-port={}".format(debug_port))
+
+    cache = _load_cache(cache_file)
+    chrome_path = cache.get("path", None)
+    if not chrome_path or not os.path.exists(chrome_path):
+        chrome_path = get_instance_path()
     if chrome_path is not None:
+        if cache.get("path") != chrome_path:
+            _save_cache(cache_file, {"path": chrome_path})
         if options['mode'] == 'chrome-app':
             for url in start_urls:
-                sps.Popen([chrome_path, '--app=%s' % url] +
-                           options['chromeFlags'],
+                sps.Popen([chrome_path, '--app=%s' % url] + flags,
                            stdout=sps.PIPE, stderr=sps.PIPE, stdin=sps.PIPE)
         else:
-            args = options['chromeFlags'] + start_urls
+            args = flags + start_urls
             sps.Popen([chrome_path, '--new-window'] + args,
                        stdout=sps.PIPE, stderr=sps.PIPE, stdin=sps.PIPE)
     else:
@@ -24,14 +126,15 @@ def run(options, start_urls):
 
 
 def get_instance_path():
-    if sys.platform in ['win32', 'win64']:
-        return find_chrome_win()
-    elif sys.platform == 'darwin':
-        return find_chrome_mac()
-    elif sys.platform.startswith('linux'):
-        return find_chrome_linux()
-    else:
-        return None
+    global _instance_path
+    if _instance_path is None:
+        if sys.platform in ['win32', 'win64']:
+            _instance_path = find_chrome_win()
+        elif sys.platform == 'darwin':
+            _instance_path = find_chrome_mac()
+        elif sys.platform.startswith('linux'):
+            _instance_path = find_chrome_linux()
+    return _instance_path
 
 
 def find_chrome_mac():
@@ -47,14 +150,13 @@ def find_chrome_mac():
 
 
 def find_chrome_linux():
-    import whichcraft as wch
     chrome_names = ['chromium-browser',
                     'chromium',
                     'google-chrome',
                     'google-chrome-stable']
 
     for name in chrome_names:
-        chrome = wch.which(name)
+        chrome = shutil.which(name)
         if chrome is not None:
             return chrome
     return None
@@ -2,8 +2,12 @@
 # -*- coding:utf-8 -*-
 # @Author : zander
 # @Time : 2021/2/20 14:59
-from vefui.rules import Rule, RequiredRule, TypeRule, JsType, LengthRule
-from typing import List, Any, Union, Tuple
+from vefui.rules import Rule, RequiredRule, TypeRule, JsType, LengthRule, compile_rules, is_empty
+from vefui.upload import DEFAULT_CHUNK_SIZE, DEFAULT_PART_SIZE, UploadHandle
+from vefui.options import OptionIndex
+from typing import List, Any, Union, Tuple, Callable, Iterable
+from itertools import islice
+import json
 
 Rules = List[Rule]
 SwitchType = Union[Tuple[bool, bool], Tuple[str, str], Tuple[int, int], Tuple[float, float]]
@@ -52,11 +56,49 @@ class FormItem:
         self._value = value
 
     def formatted_value(self):
-        return self._value
+        return self.parse(self._value)
+
+    def parse(self, value):
+        """
+        convert a submitted value to its python type
+        """
+        return value
 
     def add_rule(self, rule: Rule):
         self.rules.append(rule)
 
+    def update(self, **changes):
+        """
+        change attributes after creation, e.g. disabled=True
+        """
+        for name, value in changes.items():
+            if name.startswith("_") or not hasattr(self, name):
+                raise AttributeError("{} has no option {}".format(type(self).__name__, name))
+            setattr(self, name, value)
+        if "required" in changes and self.auto_rules:
+            self.rules = [rule for rule in self.rules if not isinstance(rule, RequiredRule)]
+            if self.required:
+                self.rules.insert(0, RequiredRule())
+
+    def compile(self) -> Callable[[Any], List[str]]:
+        """
+        compile rules and type conversion into one validator, value -> error messages
+        """
+        check = compile_rules(self.rules, self.label)
+        parse = self.parse
+        message = "{} is invalid".format(self.label)
+
+        def validate(value) -> List[str]:
+            errors = check(value)
+            if errors or is_empty(value):
+                return errors
+            try:
+                parse(value)
+            except (TypeError, ValueError):
+                return [message]
+            return errors
+        return validate
+
     def json(self):
         return {
             "component": self.component,
@@ -107,10 +149,10 @@ class Input(FormItem):
             data['maxLength'] = self.max_length
         return data
 
-    def formatted_value(self):
+    def parse(self, value):
         if self.is_number:
-            return int(self._value)
-        return self._value
+            return None if is_empty(value) else int(value)
+        return value
 
 
 class Textarea(Input):
@@ -129,18 +171,27 @@ class Upload(FormItem):
     def __init__(self, key: str, accept: str = "*", drag: bool = True,
                  select_text: str = "select file",
                  drag_text: str = "drag here",
+                 max_size: int = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 part_size: int = DEFAULT_PART_SIZE,
                  **options):
         """
 
         :param key:
         :param drag: drag model, default True
         :param accept: https://developer.mozilla.org/en-US/docs/Web/HTML/Element/input/file
+        :param max_size: max file size in bytes, default unlimited
+        :param chunk_size: bytes per disk write while receiving, default 64KB
+        :param part_size: part size of resumable uploads, default 4MB
         """
         super().__init__("upload", key=key, **options)
         self.accept = accept
         self.drag = drag
         self.select_text = select_text
         self.drag_text = drag_text
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.part_size = part_size
 
     def json(self):
         data = super().json()
@@ -148,8 +199,51 @@ class Upload(FormItem):
         data['drag'] = self.drag
         data['selectText'] = self.select_text
         data['dragText'] = self.drag_text
+        if self.max_size is not None:
+            data['maxSize'] = self.max_size
+        data['partSize'] = self.part_size
         return data
 
+    def parse(self, value):
+        """
+        :return: UploadHandle of the saved file, None without an upload
+        """
+        if is_empty(value):
+            return None
+        return value if isinstance(value, UploadHandle) else UploadHandle(value)
+
+
+class DataTable(FormItem):
+    """
+    a result table, filled by app.table(key, rows) in the submit callback.
+    the browser reads visible pages from /table/<key>, sorted and filtered on the server.
+    """
+
+    def __init__(self, key: str, columns: List[str] = None, page_size: int = 100, height: int = 400, **options):
+        """
+
+        :param key:
+        :param columns: columns shown and their order, default: all columns of the rows
+        :param page_size: rows per request
+        :param height: table height in px, rows outside of it are not rendered
+        """
+        options.setdefault("required", False)
+        super().__init__("table", key=key, **options)
+        self.columns = columns
+        self.page_size = page_size
+        self.height = height
+
+    def json(self):
+        data = super().json()
+        data['columns'] = self.columns or []
+        data['pageSize'] = self.page_size
+        data['height'] = self.height
+        return data
+
+    def parse(self, value):
+        # nothing is submitted
+        return None
+
 
 class Option:
 
@@ -165,27 +259,94 @@ class Option:
 
 
 Options = Union[List[Option], List]
+# provider(query, offset, limit) -> options
+OptionProvider = Callable[[str, int, int], Iterable]
 
 
 class Select(FormItem):
 
-    def __init__(self, key: str, options: Options, multi: bool = False, **kwargs):
+    def __init__(self, key: str, options: Union[Options, Iterable, OptionProvider],
+                 multi: bool = False, remote: bool = False, page_size: int = 50, **kwargs):
+        """
+
+        :param key:
+        :param options: options, any iterable, or a provider(query, offset, limit) -> options
+        :param multi:
+        :param remote: /init only ships the first page, the rest is searched on /options/<key>.
+            always on for a provider
+        :param page_size: options per page in remote mode
+        """
         super().__init__("select", key=key, **kwargs)
         self.multi = multi
-        self.options = [
-            option if isinstance(option, Option) else Option(option)
-            for option in options
-        ]
+        self.remote = remote or callable(options)
+        self.page_size = page_size
+        self._set_options(options)
+
+    def _set_options(self, options):
+        self.provider = options if callable(options) else None
+        self.index = None
+        self.options = []
+        if self.provider is None:
+            if self.remote:
+                self.index = OptionIndex(options)
+            else:
+                self.options = [
+                    option if isinstance(option, Option) else Option(option)
+                    for option in options
+                ]
+                self.index = OptionIndex(self.options)
+
+    def update(self, **changes):
+        options = changes.pop("options", None)
+        super().update(**changes)
+        if options is not None:
+            self.remote = self.remote or callable(options)
+            self._set_options(options)
+
+    def search(self, query: str = "", offset: int = 0, limit: int = None) -> Tuple[List[Option], bool]:
+        """
+        :return: page of options, True if there are more
+        """
+        limit = limit or self.page_size
+        if self.provider is not None:
+            found = [
+                option if isinstance(option, Option) else Option(option)
+                for option in islice(self.provider(query, offset, limit + 1), limit + 1)
+            ]
+            return found[:limit], len(found) > limit
+        page, more = self.index.search(query, offset, limit)
+        return [Option(key, label) for key, label in page], more
 
     def json(self):
         data = super().json()
         data['multi'] = self.multi
+        if self.remote:
+            page, more = self.search()
+            data['remote'] = True
+            data['pageSize'] = self.page_size
+            data['more'] = more
+        else:
+            page = self.options
         data['options'] = [
             option.json()
-            for option in self.options
+            for option in page
         ]
         return data
 
+    def parse(self, value):
+        if not self.remote:
+            return value
+        # remote selects send keys only: "k1,k2" or a json list
+        if isinstance(value, str):
+            if value.startswith("["):
+                value = json.loads(value)
+            elif self.multi:
+                value = value.split(",") if value else []
+        by_key = self.index.by_key if self.index is not None else {}
+        if self.multi:
+            return [by_key.get(str(k), k) for k in value or []]
+        return by_key.get(str(value), value) if value is not None else None
+
 
 class Date(FormItem):
 
@@ -251,13 +412,13 @@ class Slider(FormItem):
             data['range'] = self.range
         return data
 
-    def formatted_value(self):
-        if self._value is None:
+    def parse(self, value):
+        if value is None:
             return 0
         if self.range:
-            return tuple(map(self.in_type, self._value.split(",")))
+            return tuple(map(self.in_type, value.split(",")))
         else:
-            return self.in_type(self._value)
+            return self.in_type(value)
 
 
 class Switch(FormItem):
@@ -300,12 +461,12 @@ class Switch(FormItem):
             data['inactiveText'] = self.inactive_text
         return data
 
-    def formatted_value(self):
-        if self._value in ['true', 'True']:
+    def parse(self, value):
+        if value in ['true', 'True']:
             return True
-        elif self._value in ['false', 'False']:
+        elif value in ['false', 'False']:
             return False
-        return self.in_type(self._value)
+        return self.in_type(value)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,195 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/5/21 10:05
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    session TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    inputs TEXT,
+    files TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_created ON tasks (created);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, created);
+CREATE INDEX IF NOT EXISTS tasks_session ON tasks (session, created);
+CREATE TABLE IF NOT EXISTS console (
+    task TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    language TEXT,
+    message TEXT,
+    PRIMARY KEY (task, seq)
+) WITHOUT ROWID;
+"""
+_COLUMNS = ("id", "session", "status", "error", "created", "started", "finished", "inputs", "files")
+_INSERT = "INSERT OR {} INTO tasks ({}) VALUES ({})".format("{}", ", ".join(_COLUMNS), ", ".join("?" * len(_COLUMNS)))
+
+
+class TaskHistory:
+    """
+    submitted tasks, their inputs, uploads and console output in sqlite.
+    writes are queued and committed in batches by one thread, off the request path.
+    """
+
+    def __init__(self, path: Path, interval: float = 0.2, batch_size: int = 500, console_limit: int = 10000,
+                 recover: bool = True):
+        """
+
+        :param path: database file
+        :param interval: a batch collects writes for up to interval seconds
+        :param batch_size: max writes per transaction
+        :param console_limit: console lines kept per task
+        :param recover: mark runs left pending or running by a crash as failed
+        """
+        self.path = path
+        self.interval = interval
+        self.batch_size = batch_size
+        self.console_limit = console_limit
+        self._pid = os.getpid()
+        self._queue = queue.Queue()
+        self._lines = {}
+        self._local = threading.local()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        connection = self._connect()
+        connection.executescript(SCHEMA)
+        if recover:
+            connection.execute("UPDATE tasks SET status = 'failed', error = 'interrupted' "
+                               "WHERE status IN ('pending', 'running')")
+        connection.commit()
+        connection.close()
+        self._thread = threading.Thread(target=self._write, name="vefui-history", daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # wal stays consistent on a crash, the last commits may be lost
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _reader(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+            connection.row_factory = sqlite3.Row
+        return connection
+
+    def record(self, task, replace: bool = True):
+        """
+        :param replace: False keeps a row written before, used on submit so a fast task's final row wins
+        """
+        files = {
+            key: {"path": str(getattr(f, "path", f)), "size": getattr(f, "size", None),
+                  "checksum": getattr(f, "checksum", None)}
+            for key, f in task.files.items()
+        }
+        row = (task.id, task.session.id if task.session is not None else None, task.status.value, task.error,
+               task.created, task.started, task.finished,
+               json.dumps(task.values, default=str, ensure_ascii=False), json.dumps(files, ensure_ascii=False))
+        self._queue.put((_INSERT.format("REPLACE" if replace else "IGNORE"), row))
+        if task.finished is not None:
+            self._lines.pop(task.id, None)
+
+    def console(self, task_id: str, message: str, language: str = ""):
+        if os.getpid() != self._pid:
+            # forked task process, the parent records what it forwards
+            return
+        seq = self._lines.get(task_id, 0)
+        if seq >= self.console_limit:
+            return
+        self._lines[task_id] = seq + 1
+        self._queue.put(("INSERT OR REPLACE INTO console (task, seq, language, message) VALUES (?, ?, ?, ?)",
+                         (task_id, seq, language, message)))
+
+    def _write(self):
+        connection = self._connect()
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.interval
+            while item is not None and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+            stop = batch[-1] is None
+            writes = [w for w in batch if w is not None]
+            if writes:
+                with connection:
+                    for sql, row in writes:
+                        connection.execute(sql, row)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                connection.close()
+                return
+
+    def flush(self):
+        """
+        wait until queued writes are committed
+        """
+        if self._thread.is_alive():
+            self._queue.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    @staticmethod
+    def _task(row: sqlite3.Row) -> dict:
+        data = dict(row)
+        data["inputs"] = json.loads(data["inputs"] or "{}")
+        data["files"] = json.loads(data["files"] or "{}")
+        return data
+
+    def recent(self, limit: int = 50, before: float = None, status: str = None, session: str = None) -> dict:
+        """
+        newest first, pass the returned next as before for the following page
+        :param session: runs of this session only, None for every run
+        """
+        where, args = [], []
+        if before is not None:
+            where.append("created < ?")
+            args.append(before)
+        if status:
+            where.append("status = ?")
+            args.append(status)
+        if session is not None:
+            # "" matches no run, it is not "every session"
+            where.append("session = ?")
+            args.append(session)
+        sql = "SELECT * FROM tasks {} ORDER BY created DESC LIMIT ?".format(
+            "WHERE " + " AND ".join(where) if where else "")
+        rows = self._reader().execute(sql, args + [limit + 1]).fetchall()
+        tasks = [self._task(row) for row in rows[:limit]]
+        return {"tasks": tasks, "next": tasks[-1]["created"] if len(rows) > limit else None}
+
+    def get(self, task_id: str) -> Optional[dict]:
+        row = self._reader().execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return self._task(row) if row is not None else None
+
+    def output(self, task_id: str, offset: int = 0, limit: int = 1000) -> List[dict]:
+        rows = self._reader().execute(
+            "SELECT seq, language, message FROM console WHERE task = ? AND seq >= ? ORDER BY seq LIMIT ?",
+            (task_id, offset, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,179 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/5/12 14:05
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+# seconds, from a cached /init to a long upload
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ""
+    pairs = ('{}="{}"'.format(n, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+             for n, v in zip(names, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        return ["{}{} {}".format(self.name, _labels(self.labelnames, k), _number(v))
+                for k, v in sorted(self._values.items())]
+
+    @property
+    def kind(self) -> str:
+        return "counter"
+
+
+class Gauge:
+    """
+    value read from func(), only when scraped
+    """
+
+    def __init__(self, name: str, help: str, func: Callable[[], float], kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.func = func
+        self.kind = kind
+
+    def samples(self) -> List[str]:
+        return ["{} {}".format(self.name, _number(self.func()))]
+
+
+class Histogram:
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def kind(self) -> str:
+        return "histogram"
+
+    def observe(self, value: float):
+        # counts per bucket, accumulated when rendered
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        lines, seen = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            seen += count
+            lines.append('{}_bucket{{le="{}"}} {}'.format(self.name, _number(float(bound)), seen))
+        lines.append("{}_sum {}".format(self.name, _number(total)))
+        lines.append("{}_count {}".format(self.name, seen))
+        return lines
+
+
+class _NullInstrument:
+
+    def inc(self, amount: float = 1, *labels):
+        pass
+
+    def observe(self, value: float):
+        pass
+
+    @contextmanager
+    def time(self):
+        yield
+
+
+_NULL = _NullInstrument()
+
+
+class Metrics:
+    """
+    counters, gauges and histograms rendered in the prometheus text format
+    """
+    enabled = True
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, buckets))
+
+    def gauge(self, name: str, help: str, func: Callable[[], float], kind: str = "gauge") -> Gauge:
+        """
+        :param kind: gauge, or counter for totals kept elsewhere
+        """
+        return self._add(Gauge(name, help, func, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append("# HELP {} {}".format(metric.name, metric.help))
+            lines.append("# TYPE {} {}".format(metric.name, metric.kind))
+            try:
+                lines.extend(metric.samples())
+            except Exception:
+                # a failing gauge must not break the scrape
+                lines.pop()
+                lines.pop()
+        return "\n".join(lines) + "\n"
+
+
+class NullMetrics(Metrics):
+    """
+    metrics turned off, instruments do nothing
+    """
+    enabled = False
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        return _NULL
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        return _NULL
+
+    def gauge(self, name: str, help: str, func: Callable[[], float], kind: str = "gauge"):
+        return _NULL
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,78 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/4/27 10:31
+import threading
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from typing import Iterable, List, Tuple
+
+
+class OptionIndex:
+    """
+    prefix and substring search over option labels.
+    keys and labels are kept in two flat lists, Option objects are only made for served pages.
+    """
+
+    def __init__(self, options: Iterable):
+        self.keys = []
+        self.labels = []
+        for option in options:
+            key = getattr(option, "key", option)
+            self.keys.append(key)
+            self.labels.append(str(getattr(option, "label", None) or key))
+        self.by_key = {str(key): key for key in self.keys}
+        self._lock = threading.Lock()
+        self._built = False
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _build(self):
+        with self._lock:
+            if self._built:
+                return
+            lowered = [label.lower().replace("\n", " ") for label in self.labels]
+            self._order = sorted(range(len(lowered)), key=lowered.__getitem__)
+            self._sorted = [lowered[i] for i in self._order]
+            # one string for str.find, label i starts at self._starts[i]
+            self._starts = []
+            position = 0
+            for label in lowered:
+                self._starts.append(position)
+                position += len(label) + 1
+            self._text = "\n".join(lowered)
+            self._built = True
+
+    def _matches(self, query: str):
+        """
+        indexes of matching options, prefix matches first
+        """
+        low = bisect_left(self._sorted, query)
+        high = bisect_right(self._sorted, query + "\uffff")
+        yield from self._order[low:high]
+        position = self._text.find(query)
+        while position >= 0:
+            i = bisect_right(self._starts, position) - 1
+            if position != self._starts[i]:
+                yield i
+            # continue with the next label
+            if i + 1 >= len(self._starts):
+                break
+            position = self._text.find(query, self._starts[i + 1])
+
+    def search(self, query: str = "", offset: int = 0, limit: int = 50) -> Tuple[List[tuple], bool]:
+        """
+        :return: page of (key, label), True if there are more
+        """
+        query = (query or "").lower().replace("\n", " ")
+        if query:
+            self._build()
+            found = list(islice(self._matches(query), offset, offset + limit + 1))
+        else:
+            found = list(range(offset, min(offset + limit + 1, len(self.keys))))
+        return [(self.keys[i], self.labels[i]) for i in found[:limit]], len(found) > limit
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,58 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/4/29 15:20
+from typing import Any, List
+
+
+def _pointer(path: str, token) -> str:
+    return "{}/{}".format(path, str(token).replace("~", "~0").replace("/", "~1"))
+
+
+def diff(old: Any, new: Any, path: str = "") -> List[dict]:
+    """
+    json patch (rfc 6902) turning old into new, only add / remove / replace
+    """
+    if old == new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": _pointer(path, key)})
+        for key, value in new.items():
+            if key not in old:
+                ops.append({"op": "add", "path": _pointer(path, key), "value": value})
+            else:
+                ops.extend(diff(old[key], value, _pointer(path, key)))
+        return ops
+    if isinstance(old, list) and isinstance(new, list):
+        return _diff_list(old, new, path)
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+def _diff_list(old: list, new: list, path: str) -> List[dict]:
+    # common head and tail are kept, the middle is patched in place or swapped
+    size = min(len(old), len(new))
+    head = 0
+    while head < size and old[head] == new[head]:
+        head += 1
+    tail = 0
+    while tail < size - head and old[-1 - tail] == new[-1 - tail]:
+        tail += 1
+    removed = old[head:len(old) - tail]
+    added = new[head:len(new) - tail]
+    if len(removed) == len(added):
+        ops = []
+        for i, (a, b) in enumerate(zip(removed, added)):
+            ops.extend(diff(a, b, _pointer(path, head + i)))
+        return ops
+    ops = [{"op": "remove", "path": _pointer(path, head)} for _ in removed]
+    append = tail == 0
+    for i, value in enumerate(added):
+        ops.append({"op": "add", "path": _pointer(path, "-" if append else head + i), "value": value})
+    return ops
+
+
+if __name__ == "__main__":
+    pass
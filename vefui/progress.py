@@ -0,0 +1,138 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/5/25 15:40
+import inspect
+import numbers
+import threading
+import time
+from typing import Callable, Optional
+
+
+def progress_state(update) -> dict:
+    """
+    normalize a yielded update:
+    0.3 -> value, (3, 10) -> done / total, "text" -> message, dict -> merged as is
+    """
+    if isinstance(update, bool) or update is None:
+        return {}
+    if isinstance(update, numbers.Number):
+        return {"value": float(update)}
+    if isinstance(update, str):
+        return {"message": update}
+    if isinstance(update, tuple) and len(update) == 2 and all(isinstance(n, numbers.Number) for n in update):
+        done, total = update
+        return {"done": done, "total": total, "value": done / total if total else None}
+    if isinstance(update, dict):
+        state = dict(update)
+        if "value" not in state and state.get("total"):
+            state["value"] = state.get("done", 0) / state["total"]
+        return state
+    return {"data": update}
+
+
+class ProgressThrottle:
+    """
+    keep the latest progress state, emit it at most once per interval.
+    the last update always goes out, at the latest interval seconds later.
+    """
+
+    def __init__(self, emit: Callable[[dict], None], interval: float = 0.1):
+        self.emit = emit
+        self.interval = interval
+        self.state = {}
+        self.updates = 0
+        self._dirty = False
+        self._last = 0.0
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def update(self, update):
+        state = progress_state(update)
+        with self._lock:
+            self.state.update(state)
+            self.updates += 1
+            self._dirty = True
+            wait = self._last + self.interval - time.monotonic()
+            if wait > 0:
+                if self._timer is None:
+                    self._timer = threading.Timer(wait, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._timer = None
+            if not self._dirty:
+                return
+            self._dirty = False
+            self._last = time.monotonic()
+            state = dict(self.state, updates=self.updates)
+        self.emit(state)
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+        self.flush()
+
+
+# seconds between cancellation checks of an async callback
+CANCEL_POLL = 0.1
+
+
+def run_callback(func: Callable, progress: Callable, cancelled: Callable[[], bool] = None):
+    """
+    run a plain, generator, async or async generator callback.
+    every yielded value is passed to progress, cancelled() is checked between yields,
+    and every CANCEL_POLL seconds while an async callback runs.
+    :return: the callback result, or the generator return value
+    """
+    result = func()
+    if inspect.iscoroutine(result) or inspect.isasyncgen(result):
+        return _run_async(result, progress, cancelled)
+    if not inspect.isgenerator(result):
+        return result
+    try:
+        while True:
+            progress(next(result))
+            if cancelled is not None and cancelled():
+                result.close()
+                return None
+    except StopIteration as stop:
+        return stop.value
+
+
+async def _drain(generator, progress: Callable, cancelled: Callable[[], bool] = None):
+    try:
+        async for update in generator:
+            progress(update)
+            if cancelled is not None and cancelled():
+                break
+    finally:
+        await generator.aclose()
+
+
+def _run_async(awaitable, progress: Callable, cancelled: Callable[[], bool] = None):
+    # imported here, asyncio adds to the import time of every app
+    import asyncio
+
+    async def main():
+        coroutine = _drain(awaitable, progress, cancelled) if inspect.isasyncgen(awaitable) else awaitable
+        task = asyncio.ensure_future(coroutine)
+        while not task.done():
+            if cancelled is not None and cancelled():
+                task.cancel()
+                break
+            await asyncio.wait({task}, timeout=CANCEL_POLL)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            return None
+    return asyncio.run(main())
+
+
+if __name__ == "__main__":
+    pass
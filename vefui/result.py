@@ -0,0 +1,79 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/5/6 10:12
+import json
+import uuid
+from typing import Tuple
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# payloads above this are sent as several binary frames
+RESULT_CHUNK_SIZE = 1024 * 1024
+
+
+def encode(data) -> Tuple[memoryview, str, dict]:
+    """
+    :return: byte view of data, kind, meta. buffers are viewed, not copied
+    """
+    if isinstance(data, str):
+        return memoryview(data.encode("utf-8")), "text", {}
+    try:
+        view = memoryview(data)
+    except TypeError:
+        if msgpack is not None:
+            return memoryview(msgpack.packb(data, use_bin_type=True)), "msgpack", {}
+        body = json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str)
+        return memoryview(body.encode("utf-8")), "json", {}
+    meta = {}
+    if hasattr(data, "dtype") and hasattr(data, "shape"):
+        # numpy like arrays, rebuilt with new TypedArray(data) in the browser
+        meta = {"dtype": str(data.dtype), "shape": list(data.shape)}
+    if not view.c_contiguous:
+        view = memoryview(view.tobytes())
+    return view.cast("B"), "ndarray" if meta else "bytes", meta
+
+
+class Result:
+    """
+    one payload split into binary socket.io frames, each frame is copied out of the view when sent
+    """
+
+    def __init__(self, data, name: str = None, mimetype: str = None, chunk_size: int = RESULT_CHUNK_SIZE):
+        self.id = uuid.uuid4().hex
+        self.data = data
+        self.view, self.kind, self.meta = encode(data)
+        self.name = name
+        self.mimetype = mimetype or "application/octet-stream"
+        self.size = len(self.view)
+        self.chunk_size = chunk_size
+        self.chunks = max(1, -(-self.size // chunk_size))
+
+    def header(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "kind": self.kind,
+            "mimetype": self.mimetype,
+            "size": self.size,
+            "chunks": self.chunks,
+            "meta": self.meta
+        }
+
+    def frame(self, seq: int) -> dict:
+        if self.chunks == 1 and isinstance(self.data, bytes):
+            block = self.data
+        else:
+            start = seq * self.chunk_size
+            block = self.view[start:start + self.chunk_size].tobytes()
+        frame = self.header() if seq == 0 else {"id": self.id}
+        frame["seq"] = seq
+        frame["data"] = block
+        return frame
+
+
+if __name__ == "__main__":
+    pass
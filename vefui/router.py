@@ -0,0 +1,151 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/5/14 16:30
+import html
+import os
+from urllib.parse import parse_qs, urlsplit
+from pathlib import Path
+from typing import Dict, Optional
+
+from vefui import VefUI
+from vefui import chrome as brw
+
+# the form a browser opened last, for requests to /init, /submit ... that do not tell their page
+MOUNT_COOKIE = "vefui_mount"
+
+
+class Router:
+    """
+    serve many forms in one process, one hub and one asset cache, each under its own url prefix.
+
+        router = Router()
+        router.mount("/report", report_app)
+        router.mount("/import", import_app)
+        router.run(host="0.0.0.0", port=9030)
+
+    the web bundle requests /init, /submit and /socket.io from the root, those are routed
+    to the form of the page in their Referer, of their socket.io session, or else of the last
+    page opened in the browser. /<prefix>/init ... work as well.
+    """
+
+    def __init__(self, title: str = "Vefui", workspace: Path = None):
+        """
+
+        :param title: title of the index page listing the forms
+        :param workspace: keeps the shared asset cache, default: the first mounted app workspace
+        """
+        self.title = title
+        self.workspace = workspace
+        self.mounts: Dict[str, VefUI] = {}
+        self._prefixes = []
+
+    def mount(self, prefix: str, ui: VefUI):
+        prefix = "/" + prefix.strip("/")
+        if prefix == "/" or prefix in self.mounts:
+            raise ValueError("invalid or mounted prefix: {}".format(prefix))
+        self.mounts[prefix] = ui
+        # longest prefix first
+        self._prefixes = sorted(self.mounts, key=len, reverse=True)
+        return ui
+
+    def _match(self, path: str) -> Optional[str]:
+        for prefix in self._prefixes:
+            if path == prefix or path.startswith(prefix + "/"):
+                return prefix
+        return None
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "") or "/"
+        prefix = self._match(path)
+        if prefix is not None:
+            if path == prefix:
+                # index.html loads ./assets relative to the prefix
+                location = environ.get("SCRIPT_NAME", "") + prefix + "/"
+                start_response("301 Moved Permanently", [("Location", location)])
+                return [b""]
+            environ["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + prefix
+            environ["PATH_INFO"] = path[len(prefix):]
+            if environ["PATH_INFO"] == "/":
+                start_response = self._remember(prefix, environ, start_response)
+            return self.mounts[prefix].app(environ, start_response)
+        if path == "/":
+            return self._index(start_response)
+        prefix = self._referer(environ) or self._socket(path, environ) or self._cookie(environ)
+        if prefix is None:
+            start_response("404 Not Found", [("Content-Type", "text/plain")])
+            return [b"no form opened"]
+        return self.mounts[prefix].app(environ, start_response)
+
+    def _referer(self, environ) -> Optional[str]:
+        # the page of the request, two tabs on different forms each send their own
+        path = urlsplit(environ.get("HTTP_REFERER", "")).path
+        script = environ.get("SCRIPT_NAME", "")
+        if not path.startswith(script + "/"):
+            return None
+        return self._match(path[len(script):])
+
+    def _socket(self, path: str, environ) -> Optional[str]:
+        # a websocket upgrade has no referer, its session is known to one form
+        if not path.startswith("/socket.io"):
+            return None
+        sid = parse_qs(environ.get("QUERY_STRING", "")).get("sid", [None])[0]
+        if sid is None:
+            return None
+        for prefix, ui in self.mounts.items():
+            if ui.io is not None and ui.io.has_client(sid):
+                return prefix
+        return None
+
+    def _cookie(self, environ) -> Optional[str]:
+        from werkzeug.http import parse_cookie
+        prefix = parse_cookie(environ).get(MOUNT_COOKIE, None)
+        if prefix in self.mounts:
+            return prefix
+        if len(self.mounts) == 1:
+            return self._prefixes[0]
+        return None
+
+    @staticmethod
+    def _remember(prefix: str, environ, start_response):
+        from werkzeug.http import dump_cookie
+        cookie = dump_cookie(MOUNT_COOKIE, prefix, path=environ.get("SCRIPT_NAME", "")[:-len(prefix)] or "/",
+                             httponly=True, samesite="Lax")
+
+        def remember(status, headers, exc_info=None):
+            return start_response(status, list(headers) + [("Set-Cookie", cookie)], exc_info)
+        return remember
+
+    def _index(self, start_response):
+        links = "".join('<li><a href=".{0}/">{1}</a></li>'.format(html.escape(prefix), html.escape(ui.title))
+                        for prefix, ui in sorted(self.mounts.items()))
+        body = "<!DOCTYPE html><html><head><meta charset=\"UTF-8\"><title>{0}</title></head>" \
+               "<body><h3>{0}</h3><ul>{1}</ul></body></html>".format(html.escape(self.title), links)
+        start_response("200 OK", [("Content-Type", "text/html; charset=utf-8")])
+        return [body.encode("utf-8")]
+
+    def run(self, host: str = "127.0.0.1", port: int = 9030, listener=None):
+        """
+        serve headless, without a browser, until the process is stopped
+
+        :param host: interface to bind, e.g. 0.0.0.0 behind a reverse proxy
+        :param port:
+        :param listener: bound and listening socket to serve on
+        """
+        from engineio.async_drivers import gevent
+        from vefui.app import load_assets, serve
+        if not self.mounts:
+            raise ValueError("no form mounted")
+        listener = listener or brw.inherited_listener() or brw.bind(host, port)
+        workspace = self.workspace or next(iter(self.mounts.values())).workspace
+        assets = load_assets(workspace.joinpath(".assets"))
+        # forms share the session cookie
+        secret_key = os.urandom(32)
+        for ui in self.mounts.values():
+            ui.headless = True
+            ui._create_app(assets=assets, secret_key=secret_key)
+        serve(listener, self, log=any(ui.debug for ui in self.mounts.values()))
+
+
+if __name__ == "__main__":
+    pass
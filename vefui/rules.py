@@ -3,6 +3,14 @@
 # @Author : zander
 # @Time : 2021/2/22 15:30
 from enum import Enum
+from typing import Any, Callable, List, Optional
+
+# compiled rule: value -> error message or None
+Check = Callable[[Any], Optional[str]]
+
+
+def is_empty(value) -> bool:
+    return value is None or value == "" or value == []
 
 
 class Rule:
@@ -11,6 +19,12 @@ class Rule:
         self.message = message
         self.trigger = trigger
 
+    def compile(self, label: str) -> Optional[Check]:
+        """
+        python check of the rule, None if it is only checked by the client
+        """
+        return None
+
     def json(self) -> dict:
         kv = {
             "trigger": self.trigger
@@ -26,6 +40,13 @@ class RequiredRule(Rule):
         super().__init__(**options)
         self.required = True
 
+    def compile(self, label: str) -> Check:
+        message = self.message or "{} is required".format(label)
+
+        def check(value):
+            return message if is_empty(value) else None
+        return check
+
     def json(self):
         data = super().json()
         data['required'] = True
@@ -43,6 +64,19 @@ class TypeRule(Rule):
         super().__init__(**options)
         self.type = filed_type
 
+    def compile(self, label: str) -> Optional[Check]:
+        if self.type != JsType.number:
+            return None
+        message = self.message or "{} must be a number".format(label)
+
+        def check(value):
+            try:
+                float(value)
+            except (TypeError, ValueError):
+                return message
+            return None
+        return check
+
     def json(self):
         data = super().json()
         data['type'] = self.type.value
@@ -56,6 +90,20 @@ class LengthRule(Rule):
         self.min = min
         self.max = max
 
+    def compile(self, label: str) -> Check:
+        low, high = self.min or 0, self.max
+        if high is None:
+            message = self.message or "{} length must be at least {}".format(label, low)
+        else:
+            message = self.message or "{} length must be between {} and {}".format(label, low, high)
+
+        def check(value):
+            size = len(str(value))
+            if size < low or (high is not None and size > high):
+                return message
+            return None
+        return check
+
     def json(self):
         data = super().json()
         data['min'] = self.min
@@ -63,6 +111,21 @@ class LengthRule(Rule):
         return data
 
 
+def compile_rules(rules: List[Rule], label: str) -> Callable[[Any], List[str]]:
+    """
+    compile rules into one validator, value -> error messages.
+    like the client, an empty value is only checked by required rules.
+    """
+    required = [c for c in (r.compile(label) for r in rules if isinstance(r, RequiredRule)) if c]
+    checks = [c for c in (r.compile(label) for r in rules if not isinstance(r, RequiredRule)) if c]
+
+    def validate(value) -> List[str]:
+        if is_empty(value):
+            return [e for e in (c(value) for c in required) if e]
+        return [e for e in (c(value) for c in checks) if e]
+    return validate
+
+
 if __name__ == "__main__":
     r = TypeRule(message="xxx", filed_type=JsType.number)
     print(r.json())
@@ -0,0 +1,78 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/4/9 11:05
+import gzip
+import hashlib
+import json
+from typing import Callable, Dict, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 512
+
+
+class CompiledSchema:
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.body = json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        self.etag = hashlib.sha1(self.body).hexdigest()
+        self.variants: Dict[str, bytes] = {}
+        if len(self.body) >= MIN_COMPRESS_SIZE:
+            self.variants["gzip"] = gzip.compress(self.body, compresslevel=9)
+            if brotli is not None:
+                self.variants["br"] = brotli.compress(self.body)
+
+    def encoding(self, accept) -> Optional[str]:
+        """
+        best stored variant for the Accept-Encoding header
+        """
+        best, quality = None, 0
+        for name in ("br", "gzip"):
+            q = accept[name]
+            if name in self.variants and q > quality:
+                best, quality = name, q
+        return best
+
+
+class SchemaCache:
+    """
+    serialize the /init schema once, until invalidated
+    """
+
+    def __init__(self, builder: Callable[[], dict]):
+        self.builder = builder
+        self._compiled: Optional[CompiledSchema] = None
+
+    def invalidate(self):
+        self._compiled = None
+
+    def get(self) -> CompiledSchema:
+        compiled = self._compiled
+        if compiled is None:
+            compiled = self._compiled = CompiledSchema(self.builder())
+        return compiled
+
+    def response(self):
+        from flask import Response, request
+        compiled = self.get()
+        if request.if_none_match.contains(compiled.etag):
+            response = Response(status=304)
+        else:
+            encoding = compiled.encoding(request.accept_encodings)
+            response = Response(compiled.variants.get(encoding, compiled.body), mimetype="application/json")
+            if encoding is not None:
+                response.headers["Content-Encoding"] = encoding
+        response.set_etag(compiled.etag)
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,103 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/4/14 9:48
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional, Set
+
+# flask session cookie key holding the session id
+SESSION_KEY = "vefui"
+
+
+class Session:
+    """
+    state of one browser session: submitted values, uploads and socket ids
+    """
+
+    def __init__(self, session_id: str = None):
+        self.id = session_id or uuid.uuid4().hex
+        self.values: Dict[str, Any] = {}
+        # converted values, cleared per key when the raw value changes
+        self.typed: Dict[str, Any] = {}
+        self.files: Dict[str, Any] = {}
+        # checksums of the content this session sent, the only ones it may link without sending
+        self.uploaded: Set[str] = set()
+        # DataTable contents by key
+        self.tables: Dict[str, Any] = {}
+        self.sids: Set[str] = set()
+        self.tasks = []
+        self.last_seen = time.time()
+
+    @property
+    def connected(self) -> bool:
+        return bool(self.sids)
+
+    @property
+    def busy(self) -> bool:
+        return any(task.finished is None for task in self.tasks)
+
+    def touch(self):
+        self.last_seen = time.time()
+
+
+class SessionStore:
+
+    def __init__(self, max_idle: float = 3600):
+        """
+
+        :param max_idle: sessions without socket and running task are dropped after max_idle seconds
+        """
+        self.max_idle = max_idle
+        self.sessions: Dict[str, Session] = {}
+        self._sids: Dict[str, Session] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    @property
+    def clients(self) -> int:
+        return len(self._sids)
+
+    def get(self, session_id: str) -> Optional[Session]:
+        return self.sessions.get(session_id, None)
+
+    def get_or_create(self, session_id: str = None) -> Session:
+        with self._lock:
+            session = self.sessions.get(session_id, None) if session_id else None
+            if session is None:
+                self._prune()
+                session = Session(session_id)
+                self.sessions[session.id] = session
+        session.touch()
+        return session
+
+    def by_sid(self, sid: str) -> Optional[Session]:
+        return self._sids.get(sid, None)
+
+    def bind(self, sid: str, session_id: str = None) -> Session:
+        session = self.get_or_create(session_id)
+        with self._lock:
+            session.sids.add(sid)
+            self._sids[sid] = session
+        return session
+
+    def unbind(self, sid: str) -> Optional[Session]:
+        with self._lock:
+            session = self._sids.pop(sid, None)
+            if session is not None:
+                session.sids.discard(sid)
+                session.touch()
+        return session
+
+    def _prune(self):
+        deadline = time.time() - self.max_idle
+        for key in [k for k, s in self.sessions.items()
+                    if not s.connected and not s.busy and s.last_seen < deadline]:
+            del self.sessions[key]
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,79 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/4/19 16:22
+import importlib
+import json
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# taken when vefui is first imported
+ORIGIN = time.perf_counter()
+
+
+class LazyModule:
+    """
+    module imported on first attribute access
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+class StartupProfile:
+    """
+    time startup phases, relative to the first import of vefui
+    """
+
+    def __init__(self, origin: float = ORIGIN):
+        self.origin = origin
+        self.phases = []
+        self.marks = []
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, start - self.origin, time.perf_counter() - start))
+
+    def mark(self, name: str):
+        """
+        record a point in time once, e.g. first page load
+        """
+        if name not in (m[0] for m in self.marks):
+            self.marks.append((name, time.perf_counter() - self.origin))
+
+    def report(self) -> dict:
+        return {
+            "phases": [
+                {"name": name, "start": round(start, 4), "duration": round(duration, 4)}
+                for name, start, duration in self.phases
+            ],
+            "marks": {name: round(at, 4) for name, at in self.marks},
+            "total": round(time.perf_counter() - self.origin, 4)
+        }
+
+    def dump(self, path: Path = None):
+        """
+        write the report to stderr and, packaged apps have no console, to path
+        """
+        text = json.dumps(self.report(), indent=2)
+        if sys.stderr is not None:
+            print(text, file=sys.stderr)
+        if path is not None:
+            path.write_text(text)
+        return text
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,203 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/5/28 14:10
+import threading
+from array import array
+from collections import OrderedDict
+from itertools import chain
+from typing import Any, Iterable, List, Mapping, Optional
+
+# sorted and filtered indexes kept per table
+INDEX_CACHE = 8
+
+
+def _append(column, value):
+    """
+    :return: column, turned into a list when value does not fit its typed array
+    """
+    try:
+        column.append(value)
+    except (TypeError, OverflowError):
+        column = list(column)
+        column.append(value)
+    return column
+
+
+def _new_column(value):
+    # bool is an int, kept as is in a list
+    if type(value) is int:
+        return array("q")
+    if type(value) is float:
+        return array("d")
+    return []
+
+
+def _typed(values: Iterable):
+    """
+    numbers in a typed array, anything else in a list. numpy arrays are kept
+    """
+    to_numpy = getattr(values, "to_numpy", None)
+    if to_numpy is not None:
+        # pandas series index by label, the array by position
+        values = to_numpy()
+    if hasattr(values, "dtype") and hasattr(values, "argsort"):
+        return values if values.dtype.kind in "biuf" else list(values)
+    column = None
+    for value in values:
+        if column is None:
+            column = _new_column(value)
+        column = _append(column, value)
+    return [] if column is None else column
+
+
+def _json_value(value):
+    if value is None or isinstance(value, (str, bool, int)):
+        return value
+    if isinstance(value, float):
+        # nan is not json
+        return None if value != value else value
+    return str(value)
+
+
+class Table:
+    """
+    rows kept column by column, numbers in typed arrays.
+    pages are read through a sorted and filtered index, cached per query.
+    """
+
+    def __init__(self, columns: List[str], data: List[Any]):
+        """
+
+        :param columns: column names
+        :param data: one array, list or numpy array per column
+        """
+        lengths = {len(column) for column in data}
+        if len(columns) != len(data) or len(lengths) > 1:
+            raise ValueError("columns must have the same length")
+        self.columns = [str(c) for c in columns]
+        self.data = data
+        self.rows = lengths.pop() if lengths else 0
+        self._indexes = OrderedDict()
+        self._texts = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, source, columns: List[str] = None):
+        """
+        :param source: a dict of columns or a DataFrame, rows as dicts or sequences, or an iterator of rows
+        :param columns: column names, or the columns picked from dicts
+        """
+        if isinstance(source, Table):
+            return source
+        if hasattr(source, "keys"):
+            columns = list(columns or source.keys())
+            return cls(columns, [_typed(source[c]) for c in columns])
+        rows = iter(source)
+        first = next(rows, None)
+        if first is None:
+            columns = list(columns or [])
+            return cls(columns, [[] for _ in columns])
+        if isinstance(first, Mapping):
+            columns = list(columns or first.keys())
+            keys = columns
+
+            def get(row, key):
+                return row.get(key, None)
+        else:
+            columns = list(columns or range(len(first)))
+            keys = range(len(columns))
+
+            def get(row, i):
+                return row[i] if i < len(row) else None
+        data = [_new_column(get(first, k)) for k in keys]
+        for row in chain([first], rows):
+            for i, k in enumerate(keys):
+                data[i] = _append(data[i], get(row, k))
+        return cls(columns, data)
+
+    def __getstate__(self):
+        # forwarded from process workers without the caches
+        return {"columns": self.columns, "data": self.data}
+
+    def __setstate__(self, state):
+        self.__init__(state["columns"], state["data"])
+
+    def json(self) -> dict:
+        return {"columns": self.columns, "total": self.rows}
+
+    def _order(self, sort: str, desc: bool):
+        column = self.data[self.columns.index(sort)]
+        if hasattr(column, "argsort"):
+            order = column.argsort(kind="stable")
+            return order[::-1].tolist() if desc else order.tolist()
+        try:
+            order = sorted(range(self.rows), key=column.__getitem__, reverse=desc)
+        except TypeError:
+            # mixed types or None: by text, None last
+            order = sorted(range(self.rows), key=lambda i: (column[i] is None, str(column[i])), reverse=desc)
+        return order
+
+    def _text(self, i: int) -> List[str]:
+        # lower case text of a column, built on the first filter
+        texts = self._texts.get(i, None)
+        if texts is None:
+            texts = self._texts[i] = ["" if v is None else str(v).lower() for v in self.data[i]]
+        return texts
+
+    def _match(self, query: str) -> bytearray:
+        query = query.lower()
+        mask = bytearray(self.rows)
+        for i in range(len(self.columns)):
+            for row, text in enumerate(self._text(i)):
+                if query in text:
+                    mask[row] = 1
+        return mask
+
+    def _index(self, sort: Optional[str], desc: bool, query: str):
+        """
+        row numbers in view order, None for all rows in order
+        """
+        if not sort and not query:
+            return None
+        key = (sort, desc, query)
+        with self._lock:
+            index = self._indexes.get(key, None)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+            order = self._order(sort, desc) if sort else range(self.rows)
+            if query:
+                mask = self._match(query)
+                order = [row for row in order if mask[row]]
+            index = self._indexes[key] = array("q", order)
+            if len(self._indexes) > INDEX_CACHE:
+                self._indexes.popitem(last=False)
+            return index
+
+    def query(self, offset: int = 0, limit: int = 100, sort: str = None, desc: bool = False,
+              query: str = "") -> dict:
+        """
+        one page of rows
+        :param sort: column name
+        :param query: text searched in every column, case insensitive
+        :return: {"total": matched rows, "offset": offset, "rows": [[...], ...]}
+        """
+        if sort and sort not in self.columns:
+            raise ValueError("unknown column {}".format(sort))
+        offset = max(offset, 0)
+        index = self._index(sort, desc, query)
+        total = self.rows if index is None else len(index)
+        window = range(offset, min(offset + limit, total)) if index is None else index[offset:offset + limit]
+        columns = []
+        for column in self.data:
+            if hasattr(column, "argsort"):
+                values = column[list(window)].tolist()
+            else:
+                values = [column[row] for row in window]
+            columns.append([_json_value(v) for v in values])
+        return {"total": total, "offset": offset, "rows": [list(row) for row in zip(*columns)]}
+
+
+if __name__ == "__main__":
+    pass
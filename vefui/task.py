@@ -0,0 +1,241 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/4/2 10:12
+import contextvars
+import multiprocessing as mp
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import Callable, Dict, Optional
+
+
+class TaskStatus(Enum):
+    pending = "pending"
+    running = "running"
+    done = "done"
+    failed = "failed"
+    cancelled = "cancelled"
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+# task of the running callback, contextvars.copy_context() carries it into the threads the callback starts
+_task = contextvars.ContextVar("vefui_task", default=None)
+# queue to the parent of a forked task process
+_queue = contextvars.ContextVar("vefui_queue", default=None)
+
+
+def current_task():
+    """
+    task running in the current worker, None outside of a task
+    """
+    return _task.get()
+
+
+def forward(kind: str, *payload) -> bool:
+    """
+    in a forked task process: pass payload to the parent, handled by the executor's handlers[kind]
+    :return: False outside of a forked task
+    """
+    queue = _queue.get()
+    if queue is None:
+        return False
+    queue.put((kind, payload))
+    return True
+
+
+class Task:
+
+    def __init__(self, func: Callable, session=None):
+        """
+
+        :param func: submit callback
+        :param session: submitting session, its values are copied so later submits can not change them
+        """
+        self.id = uuid.uuid4().hex
+        self.func = func
+        self.session = session
+        self.values = dict(session.values) if session is not None else {}
+        self.typed = dict(session.typed) if session is not None else {}
+        self.files = dict(session.files) if session is not None else {}
+        self.status = TaskStatus.pending
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        # throttled progress of the running callback
+        self.progress = None
+        self._cancel = threading.Event()
+        self._process = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+        if self._process is not None and self._process.is_alive():
+            self._process.terminate()
+
+    def json(self):
+        return {
+            "id": self.id,
+            "status": self.status.value,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished
+        }
+
+
+class TaskExecutor:
+
+    def __init__(self, io, on_complete: Callable = None,
+                 mode: str = "thread", max_workers: int = 1,
+                 max_history: int = 1000, on_output: Callable = None,
+                 handlers: Dict[str, Callable] = None):
+        """
+
+        :param io: IOApp, used to forward console messages of process workers
+        :param on_complete: called with the task when it leaves the pool
+        :param mode: thread | process ; default: thread
+        :param max_workers: pool size
+        :param max_history: finished tasks kept for lookups
+        :param on_output: called with (task, message, language, event, to, local) for messages forwarded by
+            process workers
+        :param handlers: handlers[kind](task, *payload) for what process workers forward(), see forward
+        """
+        if mode not in ("thread", "process"):
+            raise ValueError("unknown executor mode: {}".format(mode))
+        if mode == "process" and "fork" not in mp.get_all_start_methods():
+            raise EnvironmentError("process executor requires the fork start method")
+        self.io = io
+        self.on_complete = on_complete
+        self.on_output = on_output
+        self.handlers = handlers or {}
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_history = max_history
+        self.tasks: Dict[str, Task] = {}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="vefui-task")
+
+    def submit(self, func: Callable, session=None) -> Task:
+        task = Task(func, session)
+        if len(self.tasks) >= self.max_history:
+            self._prune()
+        self.tasks[task.id] = task
+        if session is not None:
+            session.tasks = [t for t in session.tasks if t.finished is None] + [task]
+        self._pool.submit(self._run, task)
+        return task
+
+    def _prune(self):
+        finished = [t for t in self.tasks.values() if t.finished is not None]
+        finished.sort(key=lambda t: t.finished)
+        for task in finished[:len(self.tasks) - self.max_history + 1]:
+            del self.tasks[task.id]
+
+    def get(self, task_id: str) -> Optional[Task]:
+        return self.tasks.get(task_id, None)
+
+    def cancel(self, task_id: str) -> bool:
+        task = self.tasks.get(task_id, None)
+        if task is None or task.finished is not None:
+            return False
+        task.cancel()
+        return True
+
+    def shutdown(self, wait: bool = False):
+        for task in self.tasks.values():
+            if task.finished is None:
+                task.cancel()
+        self._pool.shutdown(wait=wait)
+
+    def _run(self, task: Task):
+        if task.cancelled:
+            self._finish(task, TaskStatus.cancelled)
+            return
+        task.status = TaskStatus.running
+        task.started = time.time()
+        token = _task.set(task)
+        try:
+            if self.mode == "process":
+                self._run_process(task)
+            else:
+                task.func()
+        except TaskCancelled:
+            self._finish(task, TaskStatus.cancelled)
+        except Exception as e:
+            task.error = str(e.args[0]) if e.args else repr(e)
+            self._finish(task, TaskStatus.cancelled if task.cancelled else TaskStatus.failed)
+        else:
+            self._finish(task, TaskStatus.cancelled if task.cancelled else TaskStatus.done)
+        finally:
+            _task.reset(token)
+
+    def _run_process(self, task: Task):
+        ctx = mp.get_context("fork")
+        queue = ctx.Queue()
+        process = ctx.Process(target=_process_entry, args=(task, self.io, queue), daemon=True)
+        task._process = process
+        process.start()
+        error = None
+        while True:
+            try:
+                kind, payload = queue.get(timeout=0.2)
+            except Exception:
+                if process.is_alive():
+                    continue
+                break
+            if kind == "send":
+                self.io.send(*payload)
+                if self.on_output is not None:
+                    self.on_output(task, *payload)
+            elif kind == "result":
+                self.io.send_result(*payload)
+            elif kind == "exit":
+                error = payload
+                break
+            elif kind in self.handlers:
+                self.handlers[kind](task, *payload)
+        process.join()
+        task._process = None
+        if task.cancelled:
+            raise TaskCancelled()
+        if error is not None:
+            raise RuntimeError(error)
+        if process.exitcode != 0:
+            raise RuntimeError("worker exited with code {}".format(process.exitcode))
+
+    def _finish(self, task: Task, status: TaskStatus):
+        task.status = status
+        task.finished = time.time()
+        if self.on_complete is not None:
+            self.on_complete(task)
+
+
+def _process_entry(task: Task, io, queue):
+    # forked child: route console messages back to the parent
+    io.redirect(lambda *args: queue.put(("send", args)), lambda *args: queue.put(("result", args)))
+    _task.set(task)
+    _queue.set(queue)
+    error = None
+    try:
+        task.func()
+    except Exception as e:
+        error = str(e.args[0]) if e.args else repr(e)
+    queue.put(("exit", error))
+    queue.close()
+    queue.join_thread()
+    # forked from a pool thread: the normal shutdown would join that thread from itself
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,631 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/4/6 15:40
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_PART_SIZE = 4 * 1024 * 1024
+# bytes of part headers and of a text field held in memory, files are streamed to disk
+MAX_HEADER_SIZE = 16 * 1024
+MAX_FIELD_SIZE = 1024 * 1024
+# unfinished resumable uploads untouched for longer are removed
+STALE_PARTIAL = 24 * 3600
+
+
+class MultipartError(ValueError):
+    pass
+
+
+@dataclass()
+class UploadedFile:
+
+    path: Path
+    size: int
+    checksum: str
+
+
+class UploadHandle:
+    """
+    value of an Upload item, used as its path: it equals and hashes as path,
+    handle / "name" joins to it, other path attributes are passed through. the file is mapped read-only on first access to view, and unmapped by close()
+    or when the task ends.
+
+        with app.get_value("data") as data:
+            for chunk in data.chunks():
+                digest.update(chunk)
+    """
+
+    def __init__(self, path: Path, size: int = None, checksum: str = None):
+        """
+
+        :param path: uploaded file
+        :param size: known size, read from the file when needed otherwise
+        :param checksum: known sha256, computed when needed otherwise
+        """
+        self.path = Path(path)
+        self._size = size
+        self._checksum = checksum
+        self._mmap = None
+        self._view = None
+
+    @classmethod
+    def of(cls, file: UploadedFile):
+        return cls(file.path, file.size, file.checksum)
+
+    @property
+    def size(self) -> int:
+        if self._size is None:
+            self._size = self.path.stat().st_size
+        return self._size
+
+    @property
+    def checksum(self) -> str:
+        if self._checksum is None:
+            digest = hashlib.sha256()
+            for chunk in self.chunks():
+                digest.update(chunk)
+            self._checksum = digest.hexdigest()
+        return self._checksum
+
+    @property
+    def view(self) -> memoryview:
+        """
+        read-only memoryview of the whole file, slices are not copied
+        """
+        if self._view is None:
+            if self.size == 0:
+                # an empty file can not be mapped
+                self._view = memoryview(b"")
+            else:
+                with open(str(self.path), "rb") as f:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._view = memoryview(self._mmap)
+        return self._view
+
+    def chunks(self, size: int = DEFAULT_PART_SIZE):
+        """
+        iterate the mapped file in views of size bytes
+        """
+        view = self.view
+        for offset in range(0, len(view), size):
+            yield view[offset:offset + size]
+
+    def close(self):
+        """
+        unmap the file, view maps it again when used later
+        """
+        view, self._view = self._view, None
+        mapped, self._mmap = self._mmap, None
+        if view is not None:
+            view.release()
+        if mapped is not None:
+            try:
+                mapped.close()
+            except BufferError:
+                # slices are still referenced, unmapped once they are dropped
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __fspath__(self) -> str:
+        return str(self.path)
+
+    def __str__(self) -> str:
+        return str(self.path)
+
+    def __repr__(self) -> str:
+        return "UploadHandle({!r})".format(str(self.path))
+
+    def __eq__(self, other):
+        if isinstance(other, UploadHandle):
+            return self.path == other.path
+        if isinstance(other, os.PathLike):
+            return self.path == Path(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __truediv__(self, other) -> Path:
+        return self.path / other
+
+    def __getattr__(self, name):
+        # name, suffix, open(), read_text() ... of the path
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.path, name)
+
+
+class UploadWriter:
+    """
+    write a file part straight to its final path in fixed size chunks, hashing on the fly
+    """
+
+    def __init__(self, key: str, path: Path,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 max_size: int = None,
+                 on_progress: Callable = None,
+                 filename: str = None):
+        """
+
+        :param key: form item key
+        :param path: final file path
+        :param chunk_size: bytes per disk write
+        :param max_size: max file size in bytes, None is unlimited
+        :param on_progress: on_progress(writer), called after each chunk written
+        :param filename: uploaded file name, default: the name of path
+        """
+        self.key = key
+        self.path = path
+        self.filename = filename or path.name
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        self.on_progress = on_progress
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._buffer = bytearray()
+        self._file = open(str(path), "wb")
+
+    @property
+    def checksum(self) -> str:
+        return self._hash.hexdigest()
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise MultipartError("{} exceeds max size {} bytes".format(self.filename, self.max_size))
+        self._hash.update(data)
+        self._buffer += data
+        if len(self._buffer) >= self.chunk_size:
+            self._flush(len(self._buffer) - len(self._buffer) % self.chunk_size)
+
+    def _flush(self, size: int):
+        view = memoryview(self._buffer)
+        for offset in range(0, size, self.chunk_size):
+            self._file.write(view[offset:offset + self.chunk_size])
+        view.release()
+        del self._buffer[:size]
+        if self.on_progress is not None:
+            self.on_progress(self)
+
+    def close(self):
+        if self._buffer:
+            self._flush(len(self._buffer))
+        self._file.close()
+
+    def abort(self):
+        self._file.close()
+        if self.path.exists():
+            self.path.unlink()
+
+
+class _Reader:
+
+    def __init__(self, stream, read_size: int):
+        self.stream = stream
+        self.read_size = read_size
+        self.buffer = bytearray()
+
+    def _fill(self) -> bool:
+        data = self.stream.read(self.read_size)
+        if not data:
+            return False
+        self.buffer += data
+        return True
+
+    def peek(self, size: int) -> bytes:
+        while len(self.buffer) < size:
+            if not self._fill():
+                raise MultipartError("unexpected end of multipart body")
+        return bytes(self.buffer[:size])
+
+    def skip(self, marker: bytes) -> bool:
+        """
+        drop marker if the buffer starts with it
+        """
+        try:
+            if self.peek(len(marker)) != marker:
+                return False
+        except MultipartError:
+            return False
+        del self.buffer[:len(marker)]
+        return True
+
+    def read_exact(self, size: int) -> bytes:
+        self.peek(size)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def read_until(self, marker: bytes, sink: Optional[Callable] = None):
+        """
+        pass bytes before marker to sink and drop the marker,
+        bytes are flushed as they arrive so a part is never held in memory.
+        """
+        keep = len(marker) - 1
+        while True:
+            index = self.buffer.find(marker)
+            if index >= 0:
+                if sink is not None and index:
+                    sink(bytes(self.buffer[:index]))
+                del self.buffer[:index + len(marker)]
+                return
+            safe = len(self.buffer) - keep
+            if safe > 0:
+                if sink is not None:
+                    sink(bytes(self.buffer[:safe]))
+                del self.buffer[:safe]
+            if not self._fill():
+                raise MultipartError("unexpected end of multipart body")
+
+
+def _parse_headers(data: bytes) -> Dict[str, str]:
+    headers = {}
+    for line in data.decode("utf-8").split("\r\n"):
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+def _capped(parts: list, limit: int, what: str) -> Callable[[bytes], None]:
+    """
+    sink appending to parts, raising MultipartError beyond limit bytes
+    """
+    size = [0]
+
+    def sink(data: bytes):
+        size[0] += len(data)
+        if size[0] > limit:
+            raise MultipartError("{} exceeds {} bytes".format(what, limit))
+        parts.append(data)
+    return sink
+
+
+def parse_multipart(stream, boundary: bytes,
+                    on_file: Callable[[str, str], Optional[UploadWriter]],
+                    on_field: Callable[[str, str], None] = None,
+                    read_size: int = DEFAULT_CHUNK_SIZE,
+                    max_header_size: int = MAX_HEADER_SIZE,
+                    max_field_size: int = MAX_FIELD_SIZE) -> Tuple[Dict[str, str], Dict[str, UploadWriter]]:
+    """
+    parse a multipart/form-data body incrementally.
+    :param stream: request body stream
+    :param boundary: multipart boundary
+    :param on_file: on_file(key, filename) -> writer for the part, or None to discard it
+    :param on_field: on_field(key, value), called as soon as a field is read
+    :param read_size: bytes per stream read
+    :param max_header_size: bytes of the headers of one part
+    :param max_field_size: bytes of one text field
+    :return: form fields, finished writers by key
+    :raise MultipartError: malformed or truncated body, or a limit exceeded
+    """
+    from werkzeug.http import parse_options_header
+    delimiter = b"--" + boundary
+    separator = b"\r\n" + delimiter
+    reader = _Reader(stream, read_size)
+    fields = {}
+    files = {}
+    reader.read_until(delimiter)
+    while True:
+        tail = reader.read_exact(2)
+        if tail == b"--":
+            break
+        if tail != b"\r\n":
+            raise MultipartError("malformed multipart boundary")
+        if reader.peek(2) == b"\r\n":
+            # part without headers
+            reader.read_exact(2)
+            headers = {}
+        else:
+            head = []
+            reader.read_until(b"\r\n\r\n", _capped(head, max_header_size, "part header"))
+            headers = _parse_headers(b"".join(head))
+        _, options = parse_options_header(headers.get("content-disposition", ""))
+        key = options.get("name", "")
+        filename = options.get("filename", None)
+        # some encoders omit the CRLF before the delimiter of an empty part
+        empty = reader.skip(delimiter)
+        if filename is None:
+            if empty:
+                fields[key] = ""
+                if on_field is not None:
+                    on_field(key, "")
+                continue
+            value = []
+            reader.read_until(separator, _capped(value, max_field_size, "field {}".format(key)))
+            fields[key] = b"".join(value).decode("utf-8")
+            if on_field is not None:
+                on_field(key, fields[key])
+            continue
+        writer = on_file(key, Path(filename).name) if filename else None
+        if empty:
+            if writer is not None:
+                writer.close()
+                files[key] = writer
+            continue
+        if writer is None:
+            reader.read_until(separator)
+            continue
+        try:
+            reader.read_until(separator, writer.write)
+        except Exception:
+            writer.abort()
+            raise
+        writer.close()
+        files[key] = writer
+    return fields, files
+
+
+def _pwrite(fd: int, data, offset: int, lock: threading.Lock):
+    if hasattr(os, "pwrite"):
+        while data:
+            written = os.pwrite(fd, data, offset)
+            data = data[written:]
+            offset += written
+        return
+    # windows has no positional write
+    with lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        while data:
+            data = data[os.write(fd, data):]
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(str(path), "rb") as f:
+        for block in iter(lambda: f.read(DEFAULT_CHUNK_SIZE * 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _off_hub(func: Callable, *args):
+    """
+    run func in the gevent threadpool when called from a greenlet, other requests go on meanwhile
+    """
+    gevent = sys.modules.get("gevent", None)
+    if gevent is not None and isinstance(gevent.getcurrent(), gevent.Greenlet):
+        return gevent.get_hub().threadpool.apply(func, args)
+    return func(*args)
+
+
+class ChunkedUpload:
+    """
+    a resumable upload, parts are written at their offset into a preallocated file
+    """
+
+    def __init__(self, root: Path, upload_id: str, key: str, filename: str,
+                 size: int, part_size: int, received: List[int] = None):
+        self.root = root
+        self.id = upload_id
+        self.key = key
+        self.filename = filename
+        self.size = size
+        self.part_size = part_size
+        self.received = set(received or [])
+        self.checksum = None
+        # set by the first finalize call, a retry while it hashes gets an error
+        self.finalizing = False
+        self._lock = threading.Lock()
+        self._fd = None
+
+    @property
+    def part_path(self) -> Path:
+        return self.root.joinpath("{}.part".format(self.id))
+
+    @property
+    def meta_path(self) -> Path:
+        return self.root.joinpath("{}.json".format(self.id))
+
+    @property
+    def parts(self) -> int:
+        return max(1, -(-self.size // self.part_size))
+
+    @property
+    def complete(self) -> bool:
+        return len(self.received) == self.parts
+
+    def missing(self) -> List[int]:
+        return [i for i in range(self.parts) if i not in self.received]
+
+    def _open(self):
+        if self._fd is None:
+            self._fd = os.open(str(self.part_path), os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0))
+        return self._fd
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def allocate(self):
+        fd = self._open()
+        if hasattr(os, "posix_fallocate") and self.size:
+            os.posix_fallocate(fd, 0, self.size)
+        else:
+            os.ftruncate(fd, self.size)
+        self.save()
+
+    def write(self, offset: int, stream, read_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        write one part read from stream at offset
+        :return: bytes written
+        """
+        if offset % self.part_size or not 0 <= offset < max(self.size, 1):
+            raise MultipartError("invalid part offset {}".format(offset))
+        if self.finalizing:
+            raise MultipartError("upload {} is finalized".format(self.id))
+        expected = min(self.part_size, self.size - offset)
+        fd = self._open()
+        written = 0
+        while written < expected:
+            data = stream.read(min(read_size, expected - written))
+            if not data:
+                break
+            if self.finalizing:
+                # finalize started while the part was read, the file is closed
+                raise MultipartError("upload {} is finalized".format(self.id))
+            _pwrite(fd, data, offset + written, self._lock)
+            written += len(data)
+        if written != expected or stream.read(1):
+            raise MultipartError("part at {} should be {} bytes".format(offset, expected))
+        with self._lock:
+            if self.finalizing:
+                raise MultipartError("upload {} is finalized".format(self.id))
+            self.received.add(offset // self.part_size)
+            self.save()
+        return written
+
+    def finalize(self, target: Path) -> Path:
+        """
+        verify the parts and move the file to target atomically
+        :raise MultipartError: parts are missing, or another call finalizes the upload
+        """
+        with self._lock:
+            if self.finalizing:
+                raise MultipartError("upload {} is being finalized".format(self.id))
+            if not self.complete:
+                raise MultipartError("upload {} missing parts {}".format(self.id, self.missing()))
+            self.finalizing = True
+        try:
+            _off_hub(os.fsync, self._open())
+            self.close()
+            checksum = _off_hub(_sha256, self.part_path)
+            os.replace(str(self.part_path), str(target))
+            self.meta_path.unlink()
+        except BaseException:
+            self.finalizing = False
+            raise
+        self.checksum = checksum
+        return target
+
+    def save(self):
+        tmp = self.meta_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({
+            "key": self.key,
+            "filename": self.filename,
+            "size": self.size,
+            "part_size": self.part_size,
+            "received": sorted(self.received)
+        }))
+        os.replace(str(tmp), str(self.meta_path))
+
+    @classmethod
+    def load(cls, root: Path, upload_id: str):
+        meta = json.loads(root.joinpath("{}.json".format(upload_id)).read_text())
+        return cls(root, upload_id, meta["key"], meta["filename"], meta["size"],
+                   meta["part_size"], meta["received"])
+
+    def json(self):
+        return {
+            "id": self.id,
+            "key": self.key,
+            "filename": self.filename,
+            "size": self.size,
+            "partSize": self.part_size,
+            "received": sorted(self.received),
+            "complete": self.complete
+        }
+
+
+class ChunkedUploadStore:
+    """
+    resumable upload sessions, kept on disk so a reload can resume them.
+    a file is preallocated at its declared size, the sizes of unfinished uploads are
+    capped by max_pending and the free disk space, uploads idle for expire seconds are removed.
+    """
+
+    def __init__(self, root: Path, max_pending: int = None, expire: float = STALE_PARTIAL):
+        """
+
+        :param max_pending: bytes of unfinished uploads, default: the free disk space
+        :param expire: seconds an unfinished upload is kept without a new part
+        """
+        self.root = root
+        self.max_pending = max_pending
+        self.expire = expire
+        self.sessions: Dict[str, ChunkedUpload] = {}
+
+    @staticmethod
+    def upload_id(key: str, filename: str, size: int, fingerprint: str = "") -> str:
+        raw = "{}:{}:{}:{}".format(key, filename, size, fingerprint)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def open(self, key: str, filename: str, size: int,
+             part_size: int = DEFAULT_PART_SIZE, fingerprint: str = "") -> ChunkedUpload:
+        """
+        resume an upload or preallocate a new one
+        :raise MultipartError: size is negative or does not fit
+        """
+        if size < 0:
+            raise MultipartError("invalid size {}".format(size))
+        upload_id = self.upload_id(key, filename, size, fingerprint)
+        upload = self.get(upload_id)
+        if upload is None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            pending = self._clean()
+            free = shutil.disk_usage(str(self.root)).free
+            if size > free or (self.max_pending is not None and pending + size > self.max_pending):
+                raise MultipartError("{} bytes do not fit, {} bytes of uploads pending".format(size, pending))
+            upload = ChunkedUpload(self.root, upload_id, key, filename, size, part_size)
+            upload.allocate()
+            self.sessions[upload_id] = upload
+        return upload
+
+    def _clean(self) -> int:
+        """
+        remove expired uploads
+        :return: bytes allocated by the others
+        """
+        deadline = time.time() - self.expire
+        pending = 0
+        for meta in self.root.glob("*.json"):
+            part = meta.with_suffix(".part")
+            try:
+                if meta.stat().st_mtime >= deadline:
+                    pending += part.stat().st_size
+                    continue
+                upload = self.sessions.pop(meta.stem, None)
+                if upload is not None:
+                    upload.close()
+                meta.unlink()
+                part.unlink()
+            except OSError:
+                pass
+        return pending
+
+    def get(self, upload_id: str) -> Optional[ChunkedUpload]:
+        if not all(c in "0123456789abcdef" for c in upload_id):
+            return None
+        upload = self.sessions.get(upload_id, None)
+        if upload is None and self.root.joinpath("{}.json".format(upload_id)).exists():
+            upload = ChunkedUpload.load(self.root, upload_id)
+            self.sessions[upload_id] = upload
+        return upload
+
+    def finalize(self, upload_id: str, target: Path) -> ChunkedUpload:
+        upload = self.get(upload_id)
+        if upload is None:
+            raise MultipartError("upload {} not found".format(upload_id))
+        upload.finalize(target)
+        self.sessions.pop(upload_id, None)
+        return upload
+
+
+if __name__ == "__main__":
+    pass
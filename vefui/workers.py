@@ -0,0 +1,332 @@
+#! /use/bin/python3
+# -*- coding:utf-8 -*-
+# @Author : zander
+# @Time : 2021/5/18 11:20
+"""
+pre-forked worker processes behind one listening socket.
+
+the master accepts connections and hands each one to a worker over a unix socket. a browser
+sticks to one worker by cookie, engine.io long polling needs every request of a socket on
+the process that opened it. socket.io emits are published to the other workers over unix
+sockets, so an emit reaches its client on whichever worker it is connected to.
+"""
+import array
+import json
+import os
+import pickle
+import selectors
+import shutil
+import signal
+import socket
+import struct
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+from socketio import PubSubManager
+
+# index of the worker a browser sticks to
+WORKER_COOKIE = "vefui_worker"
+# connections that send no complete request head in time go to any worker
+HANDOFF_TIMEOUT = 5.0
+PEEK_SIZE = 16 * 1024
+# readable connections are peeked at this interval until their request head is complete
+PEEK_INTERVAL = 0.05
+_FRAME = struct.Struct("!I")
+_FD = array.array("i", [0]).itemsize
+
+
+def sticky(index: int):
+    """
+    flask after_request hook, pins the browser to worker index
+    """
+    value = str(index)
+
+    def pin(response):
+        from flask import request
+        if request.cookies.get(WORKER_COOKIE, None) != value:
+            response.set_cookie(WORKER_COOKIE, value, httponly=True, samesite="Lax")
+        return response
+    return pin
+
+
+def _peek(connection: socket.socket) -> Optional[bytes]:
+    """
+    :return: bytes received so far, b"" once closed, None if nothing arrived
+    """
+    try:
+        return connection.recv(PEEK_SIZE, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+    except BlockingIOError:
+        return None
+    except OSError:
+        return b""
+
+
+def _cookie_worker(head: bytes) -> Optional[int]:
+    name = WORKER_COOKIE.encode("ascii")
+    for line in head.split(b"\r\n")[1:]:
+        key, _, value = line.partition(b":")
+        if key.strip().lower() != b"cookie":
+            continue
+        for pair in value.split(b";"):
+            key, _, value = pair.strip().partition(b"=")
+            if key == name and value.isdigit():
+                return int(value)
+    return None
+
+
+def _without_seq(data):
+    if isinstance(data, dict) and "seq" in data:
+        return {k: v for k, v in data.items() if k != "seq"}
+    return data
+
+
+class BusManager(PubSubManager):
+    """
+    socket.io client manager publishing to the other workers over unix sockets, no broker
+    """
+    name = "vefui-bus"
+
+    def __init__(self, paths: List[str], index: int, channel: str = "vefui"):
+        """
+
+        :param paths: bus socket path of every worker
+        :param index: this worker
+        """
+        super().__init__(channel=channel)
+        self.path = paths[index]
+        self.peers = [path for i, path in enumerate(paths) if i != index]
+        self._connections: Dict[str, tuple] = {}
+        self._queue = None
+
+    def initialize(self):
+        from gevent import socket as gsocket
+        from gevent.queue import Queue
+        from gevent.server import StreamServer
+        self._queue = Queue()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        listener = gsocket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        listener.listen(64)
+        StreamServer(listener, self._receive).start()
+        super().initialize()
+
+    def _receive(self, sock, address):
+        stream = sock.makefile("rb")
+        while True:
+            head = stream.read(_FRAME.size)
+            if len(head) < _FRAME.size:
+                return
+            self._queue.put(pickle.loads(stream.read(_FRAME.unpack(head)[0])))
+
+    def _connection(self, path: str):
+        from gevent import socket as gsocket
+        from gevent.lock import Semaphore
+        connection = self._connections.get(path, None)
+        if connection is None:
+            sock = gsocket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(path)
+            # frames of two greenlets must not interleave
+            connection = self._connections[path] = (sock, Semaphore())
+        return connection
+
+    def _publish(self, data):
+        if data.get("method") == "emit":
+            # seq numbers the replay stream of this worker, see ReplayLog. the other workers
+            # deliver the frame without it, their clients compare seq with their own stream
+            data = dict(data, data=[_without_seq(d) for d in data["data"]])
+        frame = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        frame = _FRAME.pack(len(frame)) + frame
+        for path in self.peers:
+            try:
+                sock, lock = self._connection(path)
+                with lock:
+                    sock.sendall(frame)
+            except OSError:
+                # peer restarting, it missed this message
+                connection = self._connections.pop(path, None)
+                if connection is not None:
+                    connection[0].close()
+
+    def _listen(self):
+        while True:
+            yield self._queue.get()
+
+
+def _handoff_server():
+    from gevent import pywsgi
+    from gevent.socket import socket as GeventSocket
+
+    class HandoffServer(pywsgi.WSGIServer):
+        """
+        accepts connections passed by the master instead of a listening socket
+        """
+
+        def do_read(self):
+            try:
+                data, ancdata, _, _ = self.socket.recvmsg(256, socket.CMSG_LEN(_FD))
+            except BlockingIOError:
+                return None
+            fds = array.array("i")
+            for level, kind, payload in ancdata:
+                if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                    fds.frombytes(payload[:len(payload) - len(payload) % _FD])
+            if not fds:
+                return None
+            return GeventSocket(fileno=fds[0]), tuple(json.loads(data.decode("utf-8")))
+
+    return HandoffServer
+
+
+def _terminate(signum, frame):
+    raise SystemExit(0)
+
+
+class Master:
+
+    def __init__(self, listener: socket.socket, processes: int,
+                 target: Callable[[int, socket.socket, List[str]], None]):
+        """
+
+        :param listener: bound and listening socket
+        :param processes: number of workers
+        :param target: target(index, handoff socket, bus paths) serves forever in a worker
+        """
+        if not hasattr(os, "fork") or not hasattr(socket, "AF_UNIX"):
+            raise EnvironmentError("worker processes require fork and unix sockets")
+        self.listener = listener
+        self.processes = processes
+        self.target = target
+        self.bus_dir = tempfile.mkdtemp(prefix="vefui-bus-")
+        self.bus = [os.path.join(self.bus_dir, "w{}.sock".format(i)) for i in range(processes)]
+        # master end, worker end
+        self.handoffs = [socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM) for _ in range(processes)]
+        self.pids: Dict[int, int] = {}
+        self._next = 0
+        # accepted connections waiting for their request head -> (address, deadline)
+        self._pending = {}
+
+    def spawn(self, index: int):
+        pid = os.fork()
+        if pid:
+            self.pids[pid] = index
+            return
+        # worker
+        code = 0
+        try:
+            import gevent
+            gevent.reinit()
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            self.listener.close()
+            for connection in self._pending:
+                connection.close()
+            for i, (master_end, worker_end) in enumerate(self.handoffs):
+                master_end.close()
+                if i != index:
+                    worker_end.close()
+            handoff = self.handoffs[index][1]
+            handoff.setblocking(False)
+            self.target(index, handoff, self.bus)
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+
+    def run(self):
+        for index in range(self.processes):
+            self.spawn(index)
+        previous = signal.signal(signal.SIGTERM, _terminate)
+        try:
+            self._serve()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+            self.stop()
+
+    def stop(self):
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        for pid in list(self.pids):
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        self.pids.clear()
+        shutil.rmtree(self.bus_dir, ignore_errors=True)
+
+    def _reap(self):
+        while self.pids:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            index = self.pids.pop(pid, None)
+            if index is not None:
+                # a crashed worker is replaced, its browsers reconnect to the new one
+                self.spawn(index)
+
+    def _serve(self):
+        selector = selectors.DefaultSelector()
+        self.listener.setblocking(False)
+        selector.register(self.listener, selectors.EVENT_READ)
+        pending = self._pending
+        # readable, head incomplete: out of the selector, level triggered it would report them at once again
+        parked = set()
+        while True:
+            for key, _ in selector.select(timeout=PEEK_INTERVAL if parked else 0.5):
+                if key.fileobj is self.listener:
+                    try:
+                        connection, address = self.listener.accept()
+                    except BlockingIOError:
+                        continue
+                    pending[connection] = (address, time.monotonic() + HANDOFF_TIMEOUT)
+                    selector.register(connection, selectors.EVENT_READ)
+                    continue
+                selector.unregister(key.fileobj)
+                parked.add(key.fileobj)
+            for connection in list(parked):
+                head = _peek(connection)
+                if head is None or (head and b"\r\n\r\n" not in head and len(head) < PEEK_SIZE):
+                    continue
+                parked.discard(connection)
+                address, _ = pending.pop(connection)
+                if head:
+                    self._handoff(connection, address, _cookie_worker(head.split(b"\r\n\r\n", 1)[0]))
+                connection.close()
+            now = time.monotonic()
+            for connection, (address, deadline) in list(pending.items()):
+                if deadline < now:
+                    if connection in parked:
+                        parked.discard(connection)
+                    else:
+                        selector.unregister(connection)
+                    del pending[connection]
+                    self._handoff(connection, address, None)
+                    connection.close()
+            self._reap()
+
+    def _handoff(self, connection: socket.socket, address, index: Optional[int]):
+        if index is None or not 0 <= index < self.processes:
+            index = self._next
+            self._next = (self._next + 1) % self.processes
+        data = json.dumps(list(address[:2])).encode("utf-8")
+        fds = array.array("i", [connection.fileno()])
+        self.handoffs[index][0].sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds.tobytes())])
+
+
+def serve_worker(handoff: socket.socket, wsgi_app, log: bool = False):
+    from vefui.app import serve
+    serve(handoff, wsgi_app, log=log, server_class=_handoff_server())
+
+
+if __name__ == "__main__":
+    pass